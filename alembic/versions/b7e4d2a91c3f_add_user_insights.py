@@ -0,0 +1,34 @@
+"""add user_insights materialized table
+
+Revision ID: b7e4d2a91c3f
+Revises: 60cc43872dac
+Create Date: 2025-09-20 10:12:03.418211
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e4d2a91c3f'
+down_revision: Union[str, None] = '60cc43872dac'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        "user_insights",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("average_cycle", sa.Integer(), nullable=False),
+        sa.Column("variability_days", sa.Integer(), nullable=False),
+        sa.Column("symptoms_by_phase", sa.JSON(), nullable=False),
+        sa.Column("phase_segments", sa.JSON(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+    )
+    # Backfill with: python rebuild_insights.py (from api/); missing rows are also built lazily on read
+
+def downgrade():
+    op.drop_table("user_insights")
@@ -0,0 +1,33 @@
+"""add cycle_predictions table
+
+Revision ID: d41f8e6b2a77
+Revises: b7e4d2a91c3f
+Create Date: 2025-09-22 21:40:11.902518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f8e6b2a77'
+down_revision: Union[str, None] = 'b7e4d2a91c3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        "cycle_predictions",
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("median_cycle_days", sa.Float(), nullable=False),
+        sa.Column("variability_days", sa.Integer(), nullable=False),
+        sa.Column("next_period_start", sa.Date(), nullable=True),
+        sa.Column("cycles_used", sa.Integer(), nullable=False),
+        sa.Column("computed_at", sa.DateTime(), nullable=True),
+    )
+
+def downgrade():
+    op.drop_table("cycle_predictions")
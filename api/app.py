@@ -1,11 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from db import Base, engine
+from db import Base, engine, async_engine
+from security import hashing_stats, shutdown_hash_pool
+from user_context import prompt_stats
+from ollama_client import close_client, ollama_stats
+import vector_index
 import routes.auth as auth
 import routes.cycles as cycles
 import routes.symptoms as symptoms
 import routes.insights as insights
 import routes.phases as phases
+import routes.calendar as calendar
 import routes.rag as rag
 import routes.chat as chat
 import routes.me as me 
@@ -13,24 +19,45 @@ import routes.me as me
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Menstrual App API", version="0.2.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rag.get_driver()
+    if vector_index.LOCAL_VECTOR_INDEX:
+        try:
+            await rag.load_local_index()
+        except Exception as e:
+            # /ask retries the load lazily; Neo4j may still be starting
+            print(f"local vector index not loaded at startup: {e}")
+    yield
+    await rag.close_driver()
+    await close_client()
+    shutdown_hash_pool()
+    await async_engine.dispose()
+
+app = FastAPI(title="Menstrual App API", version="0.2.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.get("/health")
 def health():
     return {"ok": True}
 
+@app.get("/metrics")
+def metrics():
+    return {"hashing": hashing_stats(), "prompt": prompt_stats(), "ollama": ollama_stats()}
+
 app.include_router(auth.router, prefix="/auth", tags=["auth"])
 app.include_router(cycles.router, tags=["cycles"])     # /cycles/, /cycles/{cycle_id}
 app.include_router(symptoms.router, tags=["symptoms"]) # /symptoms/, /symptoms/{log_id}
 app.include_router(insights.router, tags=["insights"])
 app.include_router(phases.router, tags=["phases"])
+app.include_router(calendar.router, tags=["calendar"])
 app.include_router(rag.router, tags=["rag"])
 app.include_router(chat.router, tags=["chat"])
 app.include_router(me.router, tags=["me"])
@@ -0,0 +1,67 @@
+"""
+Benchmark: size of the question-specific evidence block sent to the chat model.
+
+    cd api && python -m bench.bench_evidence [--ttft]
+
+Compares the old raw symptom listing (up to 200 lines) with the budgeted,
+compacted evidence for 1/3/12-month windows of synthetic history. With
+--ttft, also streams both prompts through OLLAMA_BASE_URL/CHAT_MODEL and
+reports time-to-first-token.
+"""
+import asyncio, json, os, sys, time
+from datetime import timedelta
+
+import httpx
+
+from bench.bench_insights import synthetic_history
+from user_context import _format_evidence, estimate_tokens
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "qwen2.5:1.5b-instruct")
+
+
+def old_format_evidence(cycles, symptoms, subject, dfrom, dto, max_symptoms=200):
+    parts = ["QUESTION-SPECIFIC EVIDENCE", f"- Window: {dfrom.isoformat()} → {dto.isoformat()}", f"- Subject: {subject}",
+             "Cycles in window:"]
+    parts += [f"  - {c.start_date.isoformat()} to {c.end_date.isoformat()}" for c in cycles] or ["  (none)"]
+    parts.append("Symptoms in window:")
+    for s in symptoms[:max_symptoms]:
+        sev = f" (sev {s.severity})" if s.severity is not None else ""
+        parts.append(f"  - {s.date.isoformat()}: {s.symptom}{sev}")
+    if len(symptoms) > max_symptoms:
+        parts.append(f"  ... {len(symptoms) - max_symptoms} more omitted")
+    return "\n".join(parts)
+
+
+async def ttft(prompt: str) -> float:
+    async with httpx.AsyncClient(timeout=300) as client:
+        t0 = time.perf_counter()
+        async with client.stream("POST", f"{OLLAMA_BASE_URL}/api/chat", json={
+            "model": CHAT_MODEL, "stream": True, "options": {"num_predict": 1},
+            "messages": [{"role": "user", "content": prompt + "\n\nWhen did my last period start?"}],
+        }) as r:
+            r.raise_for_status()
+            async for line in r.aiter_lines():
+                if line and json.loads(line).get("message", {}).get("content"):
+                    break
+        return time.perf_counter() - t0
+
+
+def main():
+    cycles, logs = synthetic_history(2, logs_per_day=1.0)
+    end = logs[-1].date
+    for months in (1, 3, 12):
+        dfrom = end - timedelta(days=30 * months)
+        cyc = [c for c in cycles if dfrom <= c.start_date <= end]
+        sym = [s for s in logs if dfrom <= s.date <= end]
+        old = old_format_evidence(cyc, sym, "both", dfrom, end)
+        new = _format_evidence(cyc, sym, "both", dfrom, end)
+        line = (f"{months:>2} month(s), {len(sym)} logs: old ~{estimate_tokens(old)} tokens, "
+                f"compacted ~{estimate_tokens(new)} tokens")
+        if "--ttft" in sys.argv:
+            line += f" | ttft old {asyncio.run(ttft(old)):.2f}s, compacted {asyncio.run(ttft(new)):.2f}s"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
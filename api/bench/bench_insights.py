@@ -0,0 +1,58 @@
+"""
+Microbenchmark: phase labelling in compute_insights.
+
+    cd api && python -m bench.bench_insights [years]
+
+Compares the old linear span scan with PhaseIndex on synthetic history and
+checks that both label every log identically.
+"""
+import random, sys, time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+from routes.phases import compute_phases, PhaseIndex
+
+
+def synthetic_history(years: int, logs_per_day: float = 1.5, seed: int = 7):
+    rnd = random.Random(seed)
+    cycles, logs = [], []
+    d = date(2000, 1, 1)
+    end = d + timedelta(days=365 * years)
+    while d < end:
+        length = rnd.randint(24, 34)
+        cycles.append(SimpleNamespace(start_date=d, end_date=d + timedelta(days=rnd.randint(3, 6))))
+        for off in range(length):
+            for _ in range(int(logs_per_day + rnd.random())):
+                name = rnd.choice(["cramps", "mood", "headache", "bloating", "flow"])
+                logs.append(SimpleNamespace(date=d + timedelta(days=off), symptom=name, severity=rnd.randint(1, 5)))
+        d += timedelta(days=length)
+    return cycles, logs
+
+
+def linear_label(spans, d):
+    for s in spans:
+        if s.start <= d <= s.end:
+            return s.type
+    return None
+
+
+def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cycles, logs = synthetic_history(years)
+    spans = compute_phases(cycles, logs)
+    print(f"{years}y: {len(cycles)} cycles, {len(spans)} spans, {len(logs)} logs")
+
+    t0 = time.perf_counter()
+    old = [linear_label(spans, lg.date) for lg in logs]
+    t1 = time.perf_counter()
+    index = PhaseIndex(spans)
+    new = [index.label(lg.date) for lg in logs]
+    t2 = time.perf_counter()
+
+    assert old == new, "PhaseIndex disagrees with linear scan"
+    print(f"linear scan : {(t1 - t0) * 1000:8.1f} ms")
+    print(f"PhaseIndex  : {(t2 - t1) * 1000:8.1f} ms (incl. build)")
+
+
+if __name__ == "__main__":
+    main()
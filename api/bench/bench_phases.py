@@ -0,0 +1,46 @@
+"""
+Benchmark: menstruation-end detection in compute_phases.
+
+    cd api && python -m bench.bench_phases [years ...]
+
+Compares the old per-cycle filter+sort over all logs with the single merge
+pass over the precomputed flow-day index, and checks they agree.
+"""
+import sys, time
+from datetime import timedelta
+
+from bench.bench_insights import synthetic_history
+from routes.phases import flow_day_index, menstruation_ends
+
+
+def old_menstruation_end(cycle, logs):
+    flow_names = {"flow", "bleeding", "period", "spotting"}
+    flow_days = sorted([
+        lg.date for lg in logs
+        if lg.date >= cycle.start_date and (not cycle.end_date or lg.date <= cycle.end_date)
+        and (lg.symptom or "").lower() in flow_names and (lg.severity or 1) > 0
+    ])
+    if flow_days:
+        last = cycle.start_date
+        for d in flow_days:
+            if (d - last).days <= 1: last = d
+            else: break
+        return last
+    return cycle.start_date + timedelta(days=4)
+
+
+def main():
+    for years in [int(a) for a in sys.argv[1:]] or [10, 20]:
+        cycles, logs = synthetic_history(years, logs_per_day=3)
+        t0 = time.perf_counter()
+        old = [old_menstruation_end(c, logs) for c in cycles]
+        t1 = time.perf_counter()
+        new = menstruation_ends(cycles, flow_day_index(logs))
+        t2 = time.perf_counter()
+        assert old == new, "merge pass disagrees with per-cycle scan"
+        print(f"{years}y ({len(cycles)} cycles, {len(logs)} logs): "
+              f"per-cycle {(t1 - t0) * 1000:.1f} ms, merge pass {(t2 - t1) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: question-window parsing on the /chat and /ask path.
+
+    cd api && python -m bench.bench_question_window [iterations]
+    cd api && python -m bench.bench_question_window --regen-golden
+
+Checks the parser against the golden corpus (question_window_golden.json)
+and against the old per-call-compiled parser on randomly assembled
+questions, then times old vs new (cold and memoized).
+"""
+import json, os, random, re, sys, time
+from datetime import date, timedelta
+
+from user_context import (MONTHS, classify_subject, parse_question_window, _parse_question_window,
+                          _add_months, _end_of_month, _parse_iso)
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "question_window_golden.json")
+
+
+def old_parse_question_window(q, today):
+    text = q.lower().strip()
+    subj = classify_subject(text)
+    m = re.search(r"(?:from|between)\s*(\d{4}-\d{1,2}-\d{1,2})\s*(?:to|and|through|-)\s*(\d{4}-\d{1,2}-\d{1,2})", text)
+    if m:
+        d1 = _parse_iso(m.group(1)); d2 = _parse_iso(m.group(2))
+        if d1 and d2 and d1 <= d2:
+            return subj, d1, d2
+    m = re.search(r"(?:on\s*)?(\d{4}-\d{1,2}-\d{1,2})", text)
+    if m:
+        d = _parse_iso(m.group(1))
+        if d:
+            return subj, d, d
+    m = re.search(r"last\s+(\d+)\s+months?", text)
+    if m:
+        n = int(m.group(1))
+        dfrom = _add_months(today.replace(day=1), -n)
+        dto = (today.replace(day=1) - timedelta(days=1))
+        if dfrom <= dto:
+            return subj, dfrom, dto
+    if re.search(r"last\s+month", text):
+        return subj, _add_months(today.replace(day=1), -1), today.replace(day=1) - timedelta(days=1)
+    m = re.search(r"(\d+)\s+months?\s+ago", text)
+    if m:
+        target = _add_months(today.replace(day=1), -int(m.group(1)))
+        return subj, target, _end_of_month(target)
+    m = re.search(r"\b(" + "|".join(MONTHS.keys()) + r")\b(?:\s+(\d{4}))?", text)
+    if m:
+        start = date(int(m.group(2)) if m.group(2) else today.year, MONTHS[m.group(1)], 1)
+        return subj, start, _end_of_month(start)
+    m = re.search(r"\b(20\d{2})\b", text)
+    if m:
+        yr = int(m.group(1))
+        return subj, date(yr, 1, 1), date(yr, 12, 31)
+    m = re.search(r"(\d+)\s+weeks?\s+ago", text)
+    if m:
+        target = today - timedelta(weeks=int(m.group(1)))
+        start = target - timedelta(days=target.weekday())
+        return subj, start, start + timedelta(days=6)
+    if "last week" in text:
+        start_this = today - timedelta(days=today.weekday())
+        end_prev = start_this - timedelta(days=1)
+        return subj, end_prev - timedelta(days=6), end_prev
+    return None
+
+
+FRAGMENTS = [
+    "how were my cramps", "what about my period", "any headaches", "was my cycle regular",
+    "from 2025-05-01 to 2025-06-15", "between 2025-06-15 and 2025-05-01", "from2024-2-3-2024-2-9",
+    "on 2025-05-12", "2025-13-40", "12025-05-01", "last 3 months", "last 0 months ago", "last month",
+    "last months", "2 months ago", "12 months ago", "may", "May 2025", "sept 2024", "september",
+    "january 20251", "march 123", "in 2024", "2025 months ago", "3 weeks ago", "last week",
+    "mayday", "amazing", "this year", "and", "?", "lately", "  ", "1 week ago", "last  2  month",
+]
+
+
+def random_question(rng):
+    return " ".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(1, 4)))
+
+
+def to_json(result):
+    return None if result is None else [result[0], result[1].isoformat(), result[2].isoformat()]
+
+
+def regen_golden():
+    rng = random.Random(1)
+    today = date(2025, 7, 16)
+    corpus = sorted(set(FRAGMENTS) | {random_question(rng) for _ in range(150)})
+    rows = [{"question": q, "today": today.isoformat(), "expected": to_json(old_parse_question_window(q, today))}
+            for q in corpus]
+    with open(GOLDEN, "w") as f:
+        json.dump(rows, f, indent=1)
+    print(f"wrote {len(rows)} golden cases")
+
+
+def main():
+    if "--regen-golden" in sys.argv:
+        return regen_golden()
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    with open(GOLDEN) as f:
+        golden = json.load(f)
+    for row in golden:
+        today = date.fromisoformat(row["today"])
+        got = to_json(parse_question_window(row["question"], today))
+        assert got == row["expected"], f"{row['question']!r}: {got} != {row['expected']}"
+    print(f"golden corpus: {len(golden)} cases match")
+
+    rng = random.Random(7)
+    questions = [random_question(rng) for _ in range(iterations)]
+    todays = [date(2020, 1, 1) + timedelta(days=rng.randint(0, 3000)) for _ in questions]
+    for q, t in zip(questions, todays):
+        assert old_parse_question_window(q, t) == parse_question_window(q, t), q
+    print(f"differential: {iterations} random questions match")
+
+    t0 = time.perf_counter()
+    for q, t in zip(questions, todays):
+        old_parse_question_window(q, t)
+    t1 = time.perf_counter()
+    _parse_question_window.cache_clear()
+    for q, t in zip(questions, todays):
+        parse_question_window(q, t)
+    t2 = time.perf_counter()
+    # Chat traffic repeats itself: replay a small pool of questions asked "today"
+    pool = questions[:500]
+    today = date.today()
+    for q in pool:
+        parse_question_window(q, today)
+    t3 = time.perf_counter()
+    for i in range(iterations):
+        parse_question_window(pool[i % len(pool)], today)
+    t4 = time.perf_counter()
+    per = lambda a, b: (b - a) / iterations * 1e6
+    print(f"old {per(t0, t1):.1f} us/question, precompiled {per(t1, t2):.1f} us (cold), {per(t3, t4):.2f} us (memoized)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark: /ask retrieval through the local NumPy index vs Neo4j's chunk_embed_idx.
+
+    cd api && python -m bench.bench_vector_index [queries] [k]
+
+Loads the chunks from Neo4j (NEO4J_URI), runs random query vectors through
+both paths, and reports top-k overlap, the largest score difference and
+per-query latency.
+"""
+import sys, time
+
+import numpy as np
+
+from neo4j import GraphDatabase
+
+from routes.rag import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+from vector_index import ChunkIndex, LOAD_CHUNKS_CYPHER
+
+QUERY = """
+    CALL db.index.vector.queryNodes('chunk_embed_idx', $k, $vec)
+    YIELD node, score
+    MATCH (node)-[:PART_OF]->(g:Guideline)
+    RETURN g.url AS url, node.idx AS chunk, score
+    ORDER BY score DESC
+"""
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    with driver, driver.session() as session:
+        records = [r.data() for r in session.run(LOAD_CHUNKS_CYPHER)]
+        if not records:
+            sys.exit("no chunks in Neo4j; run /ingest first")
+        index = ChunkIndex()
+        index.build(records)
+        dim = len(records[0]["embedding"])
+        rng = np.random.default_rng(0)
+        # Query near real chunks so the neighbourhoods are meaningful
+        base = np.asarray([r["embedding"] for r in records], dtype=np.float32)
+        queries = base[rng.integers(0, len(base), n)] + rng.normal(0, 0.05, (n, dim)).astype(np.float32)
+
+        overlap, max_diff, t_neo, t_local = 0, 0.0, 0.0, 0.0
+        for q in queries:
+            vec = q.tolist()
+            t0 = time.perf_counter()
+            neo = [r.data() for r in session.run(QUERY, k=k, vec=vec)]
+            t1 = time.perf_counter()
+            local = index.search(vec, k)
+            t2 = time.perf_counter()
+            t_neo += t1 - t0
+            t_local += t2 - t1
+            overlap += len({(h["url"], h["chunk"]) for h in neo} & {(h["url"], h["chunk"]) for h in local})
+            for a, b in zip(neo, local):
+                max_diff = max(max_diff, abs(a["score"] - b["score"]))
+    print(f"{len(records)} chunks, {n} queries, k={k}: overlap {overlap / (n * k):.1%}, "
+          f"max score diff {max_diff:.2e}")
+    print(f"neo4j {t_neo / n * 1000:.2f} ms/query, local {t_local / n * 1000:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
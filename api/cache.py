@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+# Shared key/value cache. Redis (already in docker-compose) is used when
+# REDIS_URL is set so every worker sees the same entries and invalidations;
+# otherwise we fall back to a bounded in-process TTL cache.
+REDIS_URL = os.getenv("REDIS_URL", "")
+LOCAL_CACHE_MAX_ITEMS = int(os.getenv("LOCAL_CACHE_MAX_ITEMS", "10000"))
+
+_redis = None
+_redis_lock = threading.Lock()
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a per-key TTL."""
+
+    def __init__(self, max_items: int = 10000):
+        self.max_items = max_items
+        self._data: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+
+    def add(self, key: str, value: str, ttl: float) -> bool:
+        """Set `key` only if it is absent (or expired); True when written."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                return False
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+            return True
+
+    def delete(self, *keys: str):
+        with self._lock:
+            for k in keys:
+                self._data.pop(k, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local = TTLCache(LOCAL_CACHE_MAX_ITEMS)
+
+
+def redis_client():
+    """Lazily build the shared Redis client; None when REDIS_URL is unset."""
+    global _redis
+    if not REDIS_URL:
+        return None
+    if _redis is None:
+        with _redis_lock:
+            if _redis is None:
+                import redis
+                _redis = redis.Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=0.5)
+    return _redis
+
+
+def cache_get_many(*keys: str, local: Optional[TTLCache] = None) -> list[Optional[str]]:
+    """`local` replaces the shared fallback cache for callers that keep their own bounded store."""
+    r = redis_client()
+    if r is not None:
+        try:
+            return r.mget(keys)
+        except Exception:
+            # Cache outages must never fail a request; treat as a miss.
+            return [None] * len(keys)
+    local = _local if local is None else local
+    return [local.get(k) for k in keys]
+
+
+def cache_get(key: str) -> Optional[str]:
+    return cache_get_many(key)[0]
+
+
+def cache_set(key: str, value: str, ttl: float):
+    ttl = max(1, int(ttl))
+    r = redis_client()
+    if r is not None:
+        try:
+            r.set(key, value, ex=ttl)
+        except Exception:
+            pass
+        return
+    _local.set(key, value, ttl)
+
+
+def cache_add(key: str, value: str, ttl: float) -> bool:
+    """Write `key` only if no entry exists (SET NX), so it never overwrites a newer value."""
+    ttl = max(1, int(ttl))
+    r = redis_client()
+    if r is not None:
+        try:
+            return bool(r.set(key, value, ex=ttl, nx=True))
+        except Exception:
+            return False
+    return _local.add(key, value, ttl)
+
+
+def cache_set_many(items: dict, ttl: float, local: Optional[TTLCache] = None):
+    """Set several keys with the same TTL in one round-trip."""
+    if not items:
+        return
+    ttl = max(1, int(ttl))
+    r = redis_client()
+    if r is not None:
+        try:
+            pipe = r.pipeline(transaction=False)
+            for k, v in items.items():
+                pipe.set(k, v, ex=ttl)
+            pipe.execute()
+        except Exception:
+            pass
+        return
+    local = _local if local is None else local
+    for k, v in items.items():
+        local.set(k, v, ttl)
+
+
+def cache_delete(*keys: str):
+    if not keys:
+        return
+    r = redis_client()
+    if r is not None:
+        try:
+            r.delete(*keys)
+        except Exception:
+            pass
+        return
+    _local.delete(*keys)
+
+
+# ----- Per-user data generation -----
+# Derived per-user caches (LLM summaries, chat context) put this token in
+# their keys; rotating it after a data write makes all of that user's entries
+# unreachable at once, without having to know which keys exist.
+USER_GENERATION_TTL = 30 * 24 * 3600  # outlives anything cached under it
+
+
+def _generation_key(user_id: int) -> str:
+    return f"gen:user:{user_id}"
+
+
+def user_generation(user_id: int) -> str:
+    return cache_get(_generation_key(user_id)) or "0"
+
+
+def bump_user_generation(user_id: int):
+    cache_set(_generation_key(user_id), uuid.uuid4().hex, USER_GENERATION_TTL)
@@ -0,0 +1,124 @@
+import csv, io, json, os, zlib
+from datetime import date
+from typing import Iterator, Literal
+from sqlalchemy import select
+from db import SessionLocal
+import models
+
+ExportFormat = Literal["json", "ndjson", "csv"]
+
+EXPORT_YIELD_PER = int(os.getenv("EXPORT_YIELD_PER", "1000"))    # rows fetched per server-side cursor batch
+EXPORT_CHUNK_BYTES = int(os.getenv("EXPORT_CHUNK_BYTES", "65536"))  # flush threshold for streamed output
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+CSV_FIELDS = ["type", "id", "date", "end_date", "flow_intensity", "symptom", "severity", "tags", "notes"]
+
+
+def export_filename(fmt: ExportFormat, compress: bool) -> str:
+    return f"cyclekind-export.{fmt}" + (".gz" if compress else "")
+
+
+def export_media_type(fmt: ExportFormat, compress: bool) -> str:
+    return "application/gzip" if compress else MEDIA_TYPES[fmt]
+
+
+def _iter_records(user_id: int) -> Iterator[tuple[str, dict]]:
+    """
+    Yield ("cycle"|"symptom", row) for a user. Rows come through a server-side
+    cursor (yield_per), so memory stays flat regardless of history size. Uses
+    its own session because a StreamingResponse outlives the request's get_db.
+    """
+    cycles = (
+        select(models.CycleLog.id, models.CycleLog.start_date, models.CycleLog.end_date,
+               models.CycleLog.flow_intensity, models.CycleLog.notes)
+        .where(models.CycleLog.user_id == user_id)
+        .order_by(models.CycleLog.start_date.asc())
+    )
+    symptoms = (
+        select(models.SymptomLog.id, models.SymptomLog.date, models.SymptomLog.symptom,
+               models.SymptomLog.severity, models.SymptomLog.tags, models.SymptomLog.notes)
+        .where(models.SymptomLog.user_id == user_id)
+        .order_by(models.SymptomLog.date.asc())
+    )
+    with SessionLocal() as db:
+        for kind, stmt in (("cycle", cycles), ("symptom", symptoms)):
+            for row in db.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER)):
+                yield kind, dict(row._mapping)
+
+
+def _json_default(v):
+    if isinstance(v, date):
+        return v.isoformat()
+    raise TypeError(f"Unserializable {type(v).__name__}")
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, default=_json_default)
+
+
+def _iter_json(user_id: int) -> Iterator[str]:
+    # Same document shape as the original /me/export, written incrementally
+    yield '{"cycles": ['
+    section, first = "cycle", True
+    for kind, r in _iter_records(user_id):
+        if kind != section:
+            yield '], "symptoms": ['
+            section, first = kind, True
+        if kind == "cycle":
+            item = {"id": r["id"], "start_date": r["start_date"]}
+        else:
+            item = {k: r[k] for k in ("id", "date", "symptom", "severity", "tags", "notes")}
+        yield ("" if first else ", ") + _dumps(item)
+        first = False
+    if section == "cycle":
+        yield '], "symptoms": ['
+    yield "]}"
+
+
+def _iter_ndjson(user_id: int) -> Iterator[str]:
+    for kind, r in _iter_records(user_id):
+        yield _dumps({"type": kind, **r}) + "\n"
+
+
+def _iter_csv(user_id: int) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=CSV_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for kind, r in _iter_records(user_id):
+        row = {"type": kind, **r}
+        if kind == "cycle":
+            row["date"] = row.pop("start_date")
+        if row.get("tags") is not None:
+            row["tags"] = _dumps(row["tags"])
+        writer.writerow(row)
+        yield buf.getvalue()
+        buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+
+_WRITERS = {"json": _iter_json, "ndjson": _iter_ndjson, "csv": _iter_csv}
+
+
+def iter_export(user_id: int, fmt: ExportFormat = "json", compress: bool = False) -> Iterator[bytes]:
+    """Stream a user's export as byte chunks of roughly EXPORT_CHUNK_BYTES, optionally gzipped."""
+    gz = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress else None
+    pending: list[str] = []
+    size = 0
+    for piece in _WRITERS[fmt](user_id):
+        pending.append(piece)
+        size += len(piece)
+        if size >= EXPORT_CHUNK_BYTES:
+            data = "".join(pending).encode()
+            pending, size = [], 0
+            data = gz.compress(data) if gz else data
+            if data:
+                yield data
+    data = "".join(pending).encode()
+    if gz:
+        data = gz.compress(data) + gz.flush()
+    if data:
+        yield data
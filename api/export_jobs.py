@@ -0,0 +1,224 @@
+import hashlib, hmac, io, os, shutil, time, uuid
+from datetime import timedelta
+from typing import Iterator, Optional
+from redis.exceptions import WatchError
+from cache import redis_client
+from export import ExportFormat, iter_export, export_filename, export_media_type
+
+# Background exports: the API enqueues a job on Redis, export_worker.py streams
+# the file into MinIO (or a local directory in dev) and the client polls for a
+# time-limited download link.
+EXPORT_STORAGE = os.getenv("EXPORT_STORAGE", "local")  # "minio" | "local"
+EXPORT_LOCAL_DIR = os.getenv("EXPORT_LOCAL_DIR", "/tmp/exports")
+EXPORT_LINK_TTL = int(os.getenv("EXPORT_LINK_TTL", "3600"))        # seconds a download link stays valid
+EXPORT_JOB_TTL = int(os.getenv("EXPORT_JOB_TTL", str(24 * 3600)))  # seconds job metadata is kept
+EXPORT_QUEUE = "export:queue"
+# Finished files are deleted once no link to them can still be valid: the job
+# (and so link minting) lives EXPORT_JOB_TTL, the last link EXPORT_LINK_TTL more.
+EXPORT_RETENTION = EXPORT_JOB_TTL + EXPORT_LINK_TTL
+EXPORT_SWEEP_INTERVAL = int(os.getenv("EXPORT_SWEEP_INTERVAL", "600"))  # seconds between worker sweeps
+
+MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "minio:9000")
+MINIO_PUBLIC_ENDPOINT = os.getenv("MINIO_PUBLIC_ENDPOINT", "localhost:9000")  # host clients download from
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin")
+MINIO_SECURE = os.getenv("MINIO_SECURE", "false").lower() == "true"
+MINIO_REGION = os.getenv("MINIO_REGION", "us-east-1")
+EXPORT_BUCKET = os.getenv("EXPORT_BUCKET", "exports")
+
+JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
+
+
+def _job_key(job_id: str) -> str:
+    return f"export:job:{job_id}"
+
+
+def _user_jobs_key(user_id) -> str:
+    return f"export:user:{user_id}"
+
+
+def _minio(endpoint: str = MINIO_ENDPOINT):
+    from minio import Minio
+    return Minio(endpoint, access_key=MINIO_ACCESS_KEY, secret_key=MINIO_SECRET_KEY,
+                 secure=MINIO_SECURE, region=MINIO_REGION)
+
+
+def _require_redis():
+    r = redis_client()
+    if r is None:
+        raise RuntimeError("Background exports need REDIS_URL to be configured")
+    return r
+
+
+# ----- API side -----
+def enqueue_export(user_id: int, fmt: ExportFormat, compress: bool) -> str:
+    r = _require_redis()
+    job_id = uuid.uuid4().hex
+    job = {
+        "user_id": str(user_id),
+        "status": "queued",
+        "format": fmt,
+        "gzip": "1" if compress else "0",
+        "created_at": str(int(time.time())),
+    }
+    pipe = r.pipeline()
+    pipe.hset(_job_key(job_id), mapping=job)
+    pipe.expire(_job_key(job_id), EXPORT_JOB_TTL)
+    pipe.sadd(_user_jobs_key(user_id), job_id)
+    pipe.expire(_user_jobs_key(user_id), EXPORT_JOB_TTL)
+    pipe.lpush(EXPORT_QUEUE, job_id)
+    pipe.execute()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job = _require_redis().hgetall(_job_key(job_id))
+    return job or None
+
+
+def download_url(job_id: str, job: dict, base_url: str) -> str:
+    """Time-limited link: a presigned MinIO URL, or an HMAC-signed API URL for local storage."""
+    if EXPORT_STORAGE == "minio":
+        return _minio(MINIO_PUBLIC_ENDPOINT).presigned_get_object(EXPORT_BUCKET, job["object"], expires=timedelta(seconds=EXPORT_LINK_TTL))
+    expires = int(time.time()) + EXPORT_LINK_TTL
+    return f"{base_url.rstrip('/')}/me/export/jobs/{job_id}/download?expires={expires}&sig={sign_download(job_id, expires)}"
+
+
+def sign_download(job_id: str, expires: int) -> str:
+    return hmac.new(JWT_SECRET.encode(), f"{job_id}:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def verify_download(job_id: str, expires: int, sig: str) -> bool:
+    return expires >= time.time() and hmac.compare_digest(sign_download(job_id, expires), sig)
+
+
+def local_path(job: dict) -> str:
+    return os.path.join(EXPORT_LOCAL_DIR, job["object"])
+
+
+def purge_user_exports(user_id: int):
+    """
+    Forget a user's export jobs and delete their files (account or data
+    deletion). Jobs still queued are skipped by the worker; one already
+    running deletes its file when it finishes (see run_export_job).
+    """
+    r = redis_client()
+    if r is not None:
+        job_ids = r.smembers(_user_jobs_key(user_id))
+        r.delete(_user_jobs_key(user_id), *[_job_key(j) for j in job_ids])
+    _delete_objects(prefix=f"{user_id}/")
+
+
+def purge_expired_exports(max_age: float = EXPORT_RETENTION) -> int:
+    """Delete export files older than `max_age` seconds; returns how many went."""
+    return _delete_objects(older_than=time.time() - max_age)
+
+
+def _delete_objects(prefix: str = "", older_than: Optional[float] = None) -> int:
+    if EXPORT_STORAGE == "minio":
+        from minio.deleteobjects import DeleteObject
+        client = _minio()
+        if not client.bucket_exists(EXPORT_BUCKET):
+            return 0
+        names = [o.object_name for o in client.list_objects(EXPORT_BUCKET, prefix=prefix or None, recursive=True)
+                 if older_than is None or o.last_modified.timestamp() < older_than]
+        for err in client.remove_objects(EXPORT_BUCKET, (DeleteObject(n) for n in names)):
+            raise RuntimeError(f"could not delete {err.name}: {err.message}")
+        return len(names)
+    root = os.path.join(EXPORT_LOCAL_DIR, prefix)
+    if older_than is None and os.path.isfile(root):
+        os.remove(root)
+        return 1
+    if older_than is None:
+        n = sum(len(files) for _, _, files in os.walk(root))
+        shutil.rmtree(root, ignore_errors=True)
+        return n
+    n = 0
+    for dirpath, _, files in os.walk(root, topdown=False):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            if os.path.getmtime(path) < older_than:
+                os.remove(path)
+                n += 1
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return n
+
+
+# ----- Worker side -----
+class _IterReader(io.RawIOBase):
+    """File-like view over a bytes iterator so MinIO can multipart-upload a stream."""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            try:
+                self._buf = next(self._chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+def _store(object_name: str, chunks: Iterator[bytes], media_type: str):
+    if EXPORT_STORAGE == "minio":
+        client = _minio()
+        if not client.bucket_exists(EXPORT_BUCKET):
+            client.make_bucket(EXPORT_BUCKET)
+        client.put_object(EXPORT_BUCKET, object_name, io.BufferedReader(_IterReader(chunks)),
+                          length=-1, part_size=10 * 1024 * 1024, content_type=media_type)
+        return
+    path = os.path.join(EXPORT_LOCAL_DIR, object_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+
+def _update_job(r, key: str, mapping: dict) -> bool:
+    """
+    Write `mapping` into the job hash only if it still exists, atomically
+    (WATCH/MULTI), so a job purged by purge_user_exports or expired is never
+    recreated without a TTL. False when the job is gone.
+    """
+    with r.pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                if not pipe.exists(key):
+                    return False
+                pipe.multi()
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, EXPORT_JOB_TTL)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
+
+
+def run_export_job(r, job_id: str):
+    key = _job_key(job_id)
+    job = r.hgetall(key)
+    if not job:
+        return  # expired before a worker picked it up
+    fmt, compress = job["format"], job["gzip"] == "1"
+    object_name = f"{job['user_id']}/{job_id}/{export_filename(fmt, compress)}"
+    if not _update_job(r, key, {"status": "running", "started_at": str(int(time.time()))}):
+        return  # purged between the read and the claim
+    try:
+        _store(object_name, iter_export(int(job["user_id"]), fmt, compress), export_media_type(fmt, compress))
+    except Exception as e:
+        if not _update_job(r, key, {"status": "failed", "error": str(e)[:200]}):
+            _delete_objects(prefix=object_name)  # purged meanwhile; drop any partial file
+        raise
+    if not _update_job(r, key, {"status": "done", "object": object_name, "finished_at": str(int(time.time()))}):
+        # purge_user_exports ran while we were writing: don't leave the file behind
+        _delete_objects(prefix=object_name)
@@ -0,0 +1,42 @@
+"""
+Background export worker.
+
+    python export_worker.py
+
+Pops job ids queued by POST /me/export/jobs and streams each export into
+MinIO (or EXPORT_LOCAL_DIR). Run as many replicas as you like; BRPOP hands
+every job to exactly one of them. Between jobs, every EXPORT_SWEEP_INTERVAL
+seconds, files older than EXPORT_RETENTION are deleted.
+"""
+import os, time, traceback
+import redis
+from export_jobs import EXPORT_QUEUE, EXPORT_SWEEP_INTERVAL, purge_expired_exports, run_export_job
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+
+
+def main():
+    r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+    print(f"export worker listening on {EXPORT_QUEUE}")
+    next_sweep = 0.0
+    while True:
+        if time.monotonic() >= next_sweep:
+            next_sweep = time.monotonic() + EXPORT_SWEEP_INTERVAL
+            try:
+                n = purge_expired_exports()
+                if n:
+                    print(f"deleted {n} expired exports")
+            except Exception:
+                traceback.print_exc()
+        item = r.brpop(EXPORT_QUEUE, timeout=5)
+        if not item:
+            continue
+        _, job_id = item
+        try:
+            run_export_job(r, job_id)
+        except Exception:
+            traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, Boolean, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Date, Boolean, ForeignKey, DateTime, JSON, Float
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from db import Base
@@ -37,3 +37,23 @@ class SymptomLog(Base):
     notes = Column(String, nullable=True)
 
     user = relationship("User", back_populates="symptoms")
+
+class UserInsights(Base):
+    """Materialized /insights payload, kept current by the cycle/symptom write paths."""
+    __tablename__ = "user_insights"
+    user_id = Column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    average_cycle = Column(Integer, nullable=False)
+    variability_days = Column(Integer, nullable=False)
+    symptoms_by_phase = Column(JSON, nullable=False)
+    phase_segments = Column(JSON, nullable=False)  # PhaseIndex.to_dict(), used to label new logs
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CyclePrediction(Base):
+    """Next-period prediction per user, refreshed in bulk by predict_cycles.py."""
+    __tablename__ = "cycle_predictions"
+    user_id = Column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    median_cycle_days = Column(Float, nullable=False)
+    variability_days = Column(Integer, nullable=False)
+    next_period_start = Column(Date, nullable=True)
+    cycles_used = Column(Integer, nullable=False)
+    computed_at = Column(DateTime, default=datetime.utcnow)
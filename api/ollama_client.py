@@ -0,0 +1,199 @@
+import asyncio
+import base64
+import hashlib
+import os
+import time
+from array import array
+from typing import List, Optional
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from cache import TTLCache, cache_get_many, cache_set_many
+
+# One pooled HTTP client for every Ollama call (chat, /insights/llm, /ask,
+# /ingest). It lives for the app's lifetime so connections are reused, and is
+# closed from the FastAPI lifespan.
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
+CHAT_MODEL = os.getenv("CHAT_MODEL", "qwen2.5:1.5b-instruct")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text:latest")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")  # how long Ollama keeps a model loaded after a call
+
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5"))
+OLLAMA_CHAT_TIMEOUT = float(os.getenv("OLLAMA_CHAT_TIMEOUT", "120"))
+OLLAMA_EMBED_TIMEOUT = float(os.getenv("OLLAMA_EMBED_TIMEOUT", "60"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "20"))
+
+# Embedding throughput: texts go to /api/embed in batches, several batches in
+# flight at once. Servers without the batch endpoint (Ollama < 0.3) fall back
+# to one /api/embeddings request per text under the same concurrency limit.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "3"))
+EMBED_RETRY_BACKOFF = float(os.getenv("EMBED_RETRY_BACKOFF", "0.5"))  # seconds, doubled per attempt
+
+# Embeddings are content-addressed by (EMBED_MODEL, sha256(text)), so re-ingesting
+# unchanged guidelines or asking a popular question skips the model entirely.
+# Stored as base64 float32 (~4 KB each) in Redis, which evicts them under its
+# maxmemory policy. Without Redis they get their own bounded in-process store,
+# so an ingest can't push identity/context entries out of the shared one.
+EMBED_CACHE_TTL = int(os.getenv("EMBED_CACHE_TTL", str(30 * 24 * 3600)))  # 0 disables
+EMBED_LOCAL_CACHE_MAX_ITEMS = int(os.getenv("EMBED_LOCAL_CACHE_MAX_ITEMS", "5000"))
+
+_client: Optional[httpx.AsyncClient] = None
+_batch_embed_supported: Optional[bool] = None  # learned from the first call
+
+_stats = {op: {"calls": 0, "errors": 0, "ms_total": 0.0, "ms_max": 0.0} for op in ("chat", "embed")}
+_embed_cache_stats = {"hits": 0, "misses": 0}
+_embed_local = TTLCache(EMBED_LOCAL_CACHE_MAX_ITEMS)
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=OLLAMA_BASE_URL,
+            timeout=httpx.Timeout(OLLAMA_CHAT_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def ollama_stats() -> dict:
+    out = {}
+    for op, s in _stats.items():
+        out[op] = {**s, "ms_total": round(s["ms_total"], 1), "ms_max": round(s["ms_max"], 1),
+                   "ms_avg": round(s["ms_total"] / s["calls"], 1) if s["calls"] else 0.0}
+    lookups = _embed_cache_stats["hits"] + _embed_cache_stats["misses"]
+    out["embed_cache"] = {**_embed_cache_stats,
+                          "hit_rate": round(_embed_cache_stats["hits"] / lookups, 3) if lookups else 0.0}
+    return out
+
+
+async def _post(op: str, path: str, payload: dict, timeout: float) -> dict:
+    stats = _stats[op]
+    t0 = time.perf_counter()
+    try:
+        r = await get_client().post(path, json=payload,
+                                    timeout=httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT))
+        r.raise_for_status()
+        return r.json()
+    except Exception:
+        stats["errors"] += 1
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        stats["calls"] += 1
+        stats["ms_total"] += ms
+        stats["ms_max"] = max(stats["ms_max"], ms)
+
+
+# ----- Chat -----
+async def ollama_chat_messages(messages: list[dict]) -> str:
+    data = await _post("chat", "/api/chat", {
+        "model": CHAT_MODEL, "messages": messages, "stream": False, "keep_alive": OLLAMA_KEEP_ALIVE,
+    }, OLLAMA_CHAT_TIMEOUT)
+    # Support both message/content and response shapes
+    msg = (data.get("message") or {}).get("content") or data.get("response") or ""
+    return msg.strip()
+
+
+async def ollama_chat(system: str, user: str) -> str:
+    return await ollama_chat_messages([
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ])
+
+
+# ----- Embeddings -----
+async def _embed_post(sem: asyncio.Semaphore, path: str, payload: dict) -> dict:
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            async with sem:
+                return await _post("embed", path, payload, OLLAMA_EMBED_TIMEOUT)
+        except httpx.HTTPStatusError as e:
+            # Only overload/server errors are worth retrying
+            if e.response.status_code < 500 and e.response.status_code != 429 or attempt == EMBED_MAX_RETRIES:
+                raise
+        except httpx.TransportError:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+        await asyncio.sleep(EMBED_RETRY_BACKOFF * 2 ** attempt)
+
+
+def _route_missing(resp: httpx.Response) -> bool:
+    """
+    A 404 for the route itself comes back as a plain "404 page not found"; Ollama's
+    own 404s (e.g. the model isn't pulled yet) are JSON {"error": ...}.
+    """
+    try:
+        return "error" not in resp.json()
+    except ValueError:
+        return True
+
+
+async def _embed_batch(sem: asyncio.Semaphore, texts: List[str]) -> List[List[float]]:
+    global _batch_embed_supported
+    if _batch_embed_supported is not False:
+        try:
+            data = await _embed_post(sem, "/api/embed", {
+                "model": EMBED_MODEL, "input": texts, "keep_alive": OLLAMA_KEEP_ALIVE,
+            })
+            _batch_embed_supported = True
+            return data["embeddings"]  # unit-normalized; cosine ranking is unaffected
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code != 404 or not _route_missing(e.response):
+                raise
+            _batch_embed_supported = False
+    out = await asyncio.gather(*(
+        _embed_post(sem, "/api/embeddings", {"model": EMBED_MODEL, "prompt": t, "keep_alive": OLLAMA_KEEP_ALIVE})
+        for t in texts
+    ))
+    return [d["embedding"] for d in out]
+
+
+def _embed_key(text: str) -> str:
+    return f"emb:{EMBED_MODEL}:{hashlib.sha256(text.encode()).hexdigest()}"
+
+
+def _pack(vec: List[float]) -> str:
+    return base64.b64encode(array("f", vec).tobytes()).decode()
+
+
+def _unpack(raw: str) -> List[float]:
+    return array("f", base64.b64decode(raw)).tolist()
+
+
+async def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    sem = asyncio.Semaphore(EMBED_CONCURRENCY)
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    results = await asyncio.gather(*(_embed_batch(sem, b) for b in batches))
+    return [e for batch in results for e in batch]
+
+
+async def ollama_embed(texts: List[str]) -> List[List[float]]:
+    if not texts:
+        return []
+    if EMBED_CACHE_TTL <= 0:
+        return await _embed_uncached(texts)
+    keys = [_embed_key(t) for t in texts]
+    # Sync Redis client: keep its round-trips off the event loop
+    cached = await run_in_threadpool(cache_get_many, *keys, local=_embed_local)
+    out: List[Optional[List[float]]] = [_unpack(v) if v is not None else None for v in cached]
+    todo = {keys[i]: texts[i] for i, v in enumerate(out) if v is None}  # dedupes repeated texts
+    _embed_cache_stats["hits"] += len(texts) - len(todo)
+    _embed_cache_stats["misses"] += len(todo)
+    if todo:
+        fresh = dict(zip(todo, await _embed_uncached(list(todo.values()))))
+        await run_in_threadpool(cache_set_many, {k: _pack(v) for k, v in fresh.items()},
+                                EMBED_CACHE_TTL, local=_embed_local)
+        out = [v if v is not None else fresh[k] for k, v in zip(keys, out)]
+    return out
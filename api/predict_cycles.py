@@ -0,0 +1,114 @@
+"""
+Batch next-period predictions for every user.
+
+    python predict_cycles.py            # run nightly (cron / scheduled container)
+
+Streams (user_id, start_date) from cycle_logs in index order through a
+server-side cursor, computes each user's median cycle length, variability
+and predicted next start with vectorized NumPy, and upserts the results
+into cycle_predictions, which GET /insights reads. Predictions of users
+who no longer have any cycles are deleted at the end of the run.
+"""
+import os, time
+from datetime import date, datetime
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from db import SessionLocal
+import models
+
+PREDICT_CHUNK_ROWS = int(os.getenv("PREDICT_CHUNK_ROWS", "100000"))
+DEFAULT_CYCLE_DAYS = 28
+MIN_GAP_DAYS = 10  # same rule as phases.estimate_lengths / compute_insights
+
+
+def predict_chunk(user_ids: np.ndarray, starts: np.ndarray) -> list[dict]:
+    """
+    Predictions for complete users. `user_ids`/`starts` (date ordinals) must be
+    sorted by (user_id, start) and must not split a user across calls.
+    """
+    users, first_idx, counts = np.unique(user_ids, return_index=True, return_counts=True)
+    last_start = starts[first_idx + counts - 1]
+
+    gaps = np.diff(starts)
+    keep = (user_ids[1:] == user_ids[:-1]) & (gaps > MIN_GAP_DAYS)
+    g_user, g = user_ids[1:][keep], gaps[keep]
+
+    median = np.full(len(users), np.nan)
+    spread = np.zeros(len(users), dtype=np.int64)
+    n_gaps = np.zeros(len(users), dtype=np.int64)
+    if len(g):
+        order = np.lexsort((g, g_user))
+        g_user, g = g_user[order], g[order]
+        gu, g_first, g_count = np.unique(g_user, return_index=True, return_counts=True)
+        lo = g[g_first + (g_count - 1) // 2]
+        hi = g[g_first + g_count // 2]
+        pos = np.searchsorted(users, gu)
+        median[pos] = (lo + hi) / 2
+        spread[pos] = np.maximum.reduceat(g, g_first) - np.minimum.reduceat(g, g_first)
+        n_gaps[pos] = g_count
+
+    median = np.where(np.isnan(median), DEFAULT_CYCLE_DAYS, median)
+    next_start = last_start + np.rint(median).astype(np.int64)
+    now = datetime.utcnow()
+    return [
+        {
+            "user_id": int(u),
+            "median_cycle_days": float(m),
+            "variability_days": int(v),
+            "next_period_start": date.fromordinal(int(n)),
+            "cycles_used": int(c),
+            "computed_at": now,
+        }
+        for u, m, v, n, c in zip(users, median, spread, next_start, counts)
+    ]
+
+
+def _upsert(db, rows: list[dict]):
+    if not rows:
+        return
+    stmt = pg_insert(models.CyclePrediction)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=[models.CyclePrediction.user_id],
+        set_={k: stmt.excluded[k] for k in rows[0] if k != "user_id"},
+    ), rows)
+
+
+def main():
+    t0 = time.perf_counter()
+    started = datetime.utcnow()
+    q = (select(models.CycleLog.user_id, models.CycleLog.start_date)
+         .order_by(models.CycleLog.user_id, models.CycleLog.start_date)
+         .execution_options(yield_per=PREDICT_CHUNK_ROWS))
+    total_users = total_rows = 0
+    with SessionLocal() as read_db, SessionLocal() as write_db:
+        carry_u: list[int] = []
+        carry_s: list[int] = []
+        for part in read_db.execute(q).partitions():
+            us = carry_u + [r[0] for r in part]
+            ss = carry_s + [r[1].toordinal() for r in part]
+            # hold back the last user: their rows may continue in the next partition
+            cut = len(us)
+            while cut > 0 and us[cut - 1] == us[-1]:
+                cut -= 1
+            carry_u, carry_s = us[cut:], ss[cut:]
+            if cut:
+                rows = predict_chunk(np.array(us[:cut]), np.array(ss[:cut]))
+                _upsert(write_db, rows)
+                write_db.commit()
+                total_users += len(rows); total_rows += cut
+        if carry_u:
+            rows = predict_chunk(np.array(carry_u), np.array(carry_s))
+            _upsert(write_db, rows)
+            write_db.commit()
+            total_users += len(rows); total_rows += len(carry_u)
+        # every user still in cycle_logs was upserted above; older rows belong to users without cycles
+        stale = write_db.execute(delete(models.CyclePrediction)
+                                 .where(models.CyclePrediction.computed_at < started)).rowcount
+        write_db.commit()
+    print(f"predicted {total_users} users from {total_rows} cycles in {time.perf_counter() - t0:.1f}s"
+          f" (dropped {stale} stale predictions)")
+
+
+if __name__ == "__main__":
+    main()
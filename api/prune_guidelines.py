@@ -0,0 +1,51 @@
+"""
+Delete guidelines that are no longer part of the curated corpus.
+
+    python prune_guidelines.py payload.json [--dry-run]
+
+Operator-only: talks to Neo4j directly and is not exposed over HTTP. Every
+Guideline (and its chunks) whose url is not in the payload's `docs` is
+removed, then the corpus version is bumped so API workers with a local
+vector index reload it.
+"""
+import json, sys
+from neo4j import GraphDatabase
+from routes.rag import NEO4J_URI, NEO4J_USER, NEO4J_PASSWORD
+import vector_index
+
+
+def _prune(tx, keep_urls: list[str]) -> int:
+    tx.run("""
+        MATCH (c:Chunk)-[:PART_OF]->(g:Guideline) WHERE NOT g.url IN $urls
+        DETACH DELETE c
+    """, urls=keep_urls)
+    return tx.run("""
+        MATCH (g:Guideline) WHERE NOT g.url IN $urls
+        DETACH DELETE g
+        RETURN count(*) AS pruned
+    """, urls=keep_urls).single()["pruned"]
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "--dry-run"]
+    if len(args) != 1:
+        sys.exit("usage: python prune_guidelines.py payload.json [--dry-run]")
+    with open(args[0]) as f:
+        keep = sorted({d["url"] for d in json.load(f)["docs"]})
+    if not keep:
+        sys.exit("payload has no docs; refusing to delete the whole corpus")
+    driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+    with driver, driver.session() as session:
+        if "--dry-run" in sys.argv:
+            stale = session.run("MATCH (g:Guideline) WHERE NOT g.url IN $urls RETURN g.url AS url",
+                                urls=keep).value("url")
+            print(f"would prune {len(stale)} guidelines: {stale}")
+            return
+        pruned = session.execute_write(_prune, keep)
+    if pruned:
+        vector_index.bump_version()
+    print(f"pruned {pruned} guidelines, kept {len(keep)}")
+
+
+if __name__ == "__main__":
+    main()
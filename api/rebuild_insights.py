@@ -0,0 +1,42 @@
+"""
+Backfill / repair the user_insights table.
+
+    python rebuild_insights.py              # users without a row
+    python rebuild_insights.py --all        # every user
+    python rebuild_insights.py --user 42    # one user
+"""
+import argparse
+from db import SessionLocal
+import models
+from routes.insights import rebuild_user_insights
+
+BATCH = 200
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--all", action="store_true", help="rebuild every user, not just missing ones")
+    ap.add_argument("--user", type=int, help="rebuild a single user")
+    args = ap.parse_args()
+
+    with SessionLocal() as db:
+        if args.user:
+            user_ids = [args.user]
+        else:
+            q = db.query(models.User.id)
+            if not args.all:
+                q = q.outerjoin(models.UserInsights, models.UserInsights.user_id == models.User.id) \
+                     .filter(models.UserInsights.user_id.is_(None))
+            user_ids = [uid for (uid,) in q.order_by(models.User.id).all()]
+
+        for i, uid in enumerate(user_ids, 1):
+            rebuild_user_insights(db, uid)
+            if i % BATCH == 0:
+                db.commit()
+                print(f"rebuilt {i}/{len(user_ids)}")
+        db.commit()
+        print(f"rebuilt {len(user_ids)} user(s)")
+
+
+if __name__ == "__main__":
+    main()
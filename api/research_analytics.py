@@ -0,0 +1,154 @@
+"""
+Offline cohort analytics for users who opted in (users.allow_research).
+
+    python research_analytics.py --out ./research-out [--workers 8] [--chunk-users 500]
+
+Consenting users are streamed in chunks from a server-side cursor; each
+chunk's cycles and symptoms are analysed in a process pool (phase labelling
+reuses compute_phases/PhaseIndex) and only aggregate counts come back, so
+memory stays bounded by chunk size and throughput scales with cores.
+Outputs (Parquet): cycle-length distribution and symptom prevalence by
+phase. Cells with fewer than MIN_CELL_USERS users are suppressed.
+"""
+import argparse, json, os, time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from itertools import groupby
+import multiprocessing
+
+from sqlalchemy import select
+from db import SessionLocal
+import models
+
+MIN_CELL_USERS = int(os.getenv("RESEARCH_MIN_CELL_USERS", "5"))
+MIN_GAP_DAYS = 10  # same rule as phases.estimate_lengths
+
+CycleRow = namedtuple("CycleRow", "user_id start_date end_date")
+LogRow = namedtuple("LogRow", "user_id date symptom severity")
+
+
+def analyze_chunk(cycles: list[CycleRow], logs: list[LogRow]) -> dict:
+    """Aggregate one chunk of users. Runs in a worker process; returns counts only."""
+    from routes.phases import compute_phases, PhaseIndex
+
+    lengths: Counter = Counter()                 # cycle length -> interval count
+    length_users: Counter = Counter()            # cycle length -> distinct users
+    phase_logs: Counter = Counter()              # (phase, symptom) -> log count
+    phase_users: Counter = Counter()             # (phase, symptom) -> distinct users
+    logs_by_user = {u: list(g) for u, g in groupby(logs, key=lambda r: r.user_id)}
+    users = 0
+    for user_id, user_cycles in groupby(cycles, key=lambda r: r.user_id):
+        user_cycles = list(user_cycles)
+        users += 1
+        user_lengths = set()
+        for a, b in zip(user_cycles, user_cycles[1:]):
+            d = (b.start_date - a.start_date).days
+            if d > MIN_GAP_DAYS:
+                lengths[d] += 1
+                user_lengths.add(d)
+        length_users.update(user_lengths)
+        user_logs = logs_by_user.get(user_id, [])
+        index = PhaseIndex(compute_phases(user_cycles, user_logs))
+        seen = set()
+        for lg in user_logs:
+            lab = index.label(lg.date)
+            if not lab:
+                continue
+            key = (lab, (lg.symptom or "").lower())
+            phase_logs[key] += 1
+            seen.add(key)
+        for key in seen:
+            phase_users[key] += 1
+    return {"users": users, "lengths": lengths, "length_users": length_users,
+            "phase_logs": phase_logs, "phase_users": phase_users}
+
+
+def _iter_chunks(db, chunk_users: int):
+    """Yield (cycles, logs) for successive chunks of consenting users with at least one cycle."""
+    ids_q = (select(models.User.id)
+             .where(models.User.allow_research.is_(True))
+             .order_by(models.User.id)
+             .execution_options(yield_per=chunk_users))
+    for part in db.execute(ids_q).partitions():
+        ids = [r[0] for r in part]
+        cycles = [CycleRow(*r) for r in db.execute(
+            select(models.CycleLog.user_id, models.CycleLog.start_date, models.CycleLog.end_date)
+            .where(models.CycleLog.user_id.in_(ids))
+            .order_by(models.CycleLog.user_id, models.CycleLog.start_date))]
+        logs = [LogRow(*r) for r in db.execute(
+            select(models.SymptomLog.user_id, models.SymptomLog.date,
+                   models.SymptomLog.symptom, models.SymptomLog.severity)
+            .where(models.SymptomLog.user_id.in_(ids))
+            .order_by(models.SymptomLog.user_id, models.SymptomLog.date))]
+        if cycles:
+            yield cycles, logs
+
+
+def _write_outputs(out_dir: str, totals: dict):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    lengths = sorted(k for k, n in totals["length_users"].items() if n >= MIN_CELL_USERS)
+    pq.write_table(pa.table({
+        "cycle_length_days": pa.array(lengths, pa.int16()),
+        "users": pa.array([totals["length_users"][k] for k in lengths], pa.int64()),
+        "cycles": pa.array([totals["lengths"][k] for k in lengths], pa.int64()),
+    }), os.path.join(out_dir, "cycle_length_distribution.parquet"))
+
+    cohort = totals["users"] or 1
+    rows = sorted(k for k, n in totals["phase_users"].items() if n >= MIN_CELL_USERS)
+    pq.write_table(pa.table({
+        "phase": [p for p, _ in rows],
+        "symptom": [s for _, s in rows],
+        "users": pa.array([totals["phase_users"][k] for k in rows], pa.int64()),
+        "logs": pa.array([totals["phase_logs"][k] for k in rows], pa.int64()),
+        "prevalence": pa.array([totals["phase_users"][k] / cohort for k in rows], pa.float64()),
+    }), os.path.join(out_dir, "symptom_prevalence_by_phase.parquet"))
+
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump({
+            "generated_at": datetime.utcnow().isoformat() + "Z",
+            "cohort_users": totals["users"],
+            "cycle_intervals": sum(totals["lengths"].values()),
+            "min_cell_users": MIN_CELL_USERS,
+        }, f, indent=2)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", required=True, help="output directory for Parquet files")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    ap.add_argument("--chunk-users", type=int, default=500)
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    totals = {"users": 0, "lengths": Counter(), "length_users": Counter(),
+              "phase_logs": Counter(), "phase_users": Counter()}
+
+    def merge(part: dict):
+        totals["users"] += part["users"]
+        for k in ("lengths", "length_users", "phase_logs", "phase_users"):
+            totals[k].update(part[k])
+
+    max_in_flight = args.workers * 2  # backpressure: bounds chunks held in memory
+    with SessionLocal() as db, ProcessPoolExecutor(
+        max_workers=args.workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        pending = set()
+        for cycles, logs in _iter_chunks(db, args.chunk_users):
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    merge(fut.result())
+            pending.add(pool.submit(analyze_chunk, cycles, logs))
+        for fut in pending:
+            merge(fut.result())
+
+    _write_outputs(args.out, totals)
+    print(f"analysed {totals['users']} consenting users in {time.perf_counter() - t0:.1f}s -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from db import get_db
+import models, os
+from .deps import get_current_user_id
+from .phases import compute_phases
+
+router = APIRouter()
+
+MAX_CALENDAR_MONTHS = int(os.getenv("MAX_CALENDAR_MONTHS", "36"))
+
+def _month_bounds(month: str) -> tuple[date, date]:
+    try:
+        y, m = map(int, month.split("-"))
+        first = date(y, m, 1)
+    except ValueError:
+        raise HTTPException(422, detail="Months must look like YYYY-MM.")
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first, last
+
+@router.get("/calendar")
+def get_calendar(
+    month_from: str = Query(..., alias="from"),
+    month_to: str = Query(..., alias="to"),
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Cycles, symptoms and phases for every month in [from, to], grouped per month.
+    One fetch of each slice and one compute_phases run for the whole range,
+    instead of /cycles, /symptoms and /phases per visible month.
+    """
+    first, _ = _month_bounds(month_from)
+    range_last_first, last = _month_bounds(month_to)
+    months: list[tuple[date, date]] = []
+    m0 = first
+    while m0 <= range_last_first:
+        months.append((m0, (m0.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)))
+        m0 = months[-1][1] + timedelta(days=1)
+    if not months:
+        raise HTTPException(422, detail="'from' must not be after 'to'.")
+    if len(months) > MAX_CALENDAR_MONTHS:
+        raise HTTPException(422, detail=f"At most {MAX_CALENDAR_MONTHS} months per request.")
+
+    cycles = (db.query(models.CycleLog)
+              .filter(models.CycleLog.user_id==user_id,
+                      models.CycleLog.start_date <= last,
+                      or_(models.CycleLog.end_date.is_(None), models.CycleLog.end_date >= first))
+              .order_by(models.CycleLog.start_date.asc()).all())
+    # The next cycle after the range gives the last visible cycle its true length
+    following = (db.query(models.CycleLog)
+                 .filter(models.CycleLog.user_id==user_id, models.CycleLog.start_date > last)
+                 .order_by(models.CycleLog.start_date.asc()).first())
+    # Same ±35 day margin as /phases so flow logs around the edges are seen
+    logs = (db.query(models.SymptomLog)
+            .filter(models.SymptomLog.user_id==user_id,
+                    models.SymptomLog.date >= first - timedelta(days=35),
+                    models.SymptomLog.date <= last + timedelta(days=35))
+            .order_by(models.SymptomLog.date.asc(), models.SymptomLog.id.asc()).all())
+    spans = compute_phases(cycles + ([following] if following else []), logs)
+    log_dates = [lg.date for lg in logs]
+
+    out = []
+    for m_first, m_last in months:
+        phases = []
+        for s in spans:
+            s0 = max(m_first, s.start); s1 = min(m_last, s.end)
+            if s1 >= s0: phases.append({"type": s.type, "start": s0.isoformat(), "end": s1.isoformat()})
+        out.append({
+            "month": m_first.strftime("%Y-%m"),
+            "cycles": [c for c in cycles if c.start_date <= m_last and (c.end_date is None or c.end_date >= m_first)],
+            "symptoms": logs[bisect_left(log_dates, m_first):bisect_right(log_dates, m_last)],
+            "phases": phases,
+        })
+    return {"from": month_from, "to": month_to, "months": out}
@@ -1,38 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException
 import requests, os
-from sqlalchemy.orm import Session
-from db import get_db
-import models
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 from routes.deps import get_current_user_id  # adjust if named differently
-from user_context import summarize_user
+from user_context import summarize_user_async
 import schemas
-from .rag import ollama_chat, ollama_chat_messages  # add the new import
+from ollama_client import ollama_chat, ollama_chat_messages
 
 router = APIRouter()
 
 RAG_URL = os.getenv("RAG_URL", "http://localhost:8000/ask")
 
-def user_summary(db: Session, user_id: int) -> str:
-    from datetime import date, timedelta
-    from collections import Counter
-    cycles = db.query(models.CycleLog).filter(models.CycleLog.user_id == user_id).order_by(models.CycleLog.start_date.asc()).all()
-    avg = None
-    if len(cycles) >= 2:
-        lens, prev = [], None
-        for c in cycles:
-            if prev: lens.append((c.start_date - prev.start_date).days)
-            prev = c
-        avg = sum(lens)/len(lens) if lens else None
-    last = cycles[-1].start_date if cycles else None
-    since = date.today() - timedelta(days=90)
-    syms = db.query(models.SymptomLog).filter(models.SymptomLog.user_id == user_id,
-                                              models.SymptomLog.date >= since).all()
-    common = [s for s,_ in Counter([x.symptom for x in syms]).most_common(3)]
-    return f"User summary: avg_cycle_days={avg}, last_period_start={last}, common_recent_symptoms={common}."
-
 
 @router.post("/chat")
-async def chat(body: schemas.ChatIn, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+async def chat(body: schemas.ChatIn, db: AsyncSession = Depends(get_async_db), user_id: int = Depends(get_current_user_id)):
     # extract a question string from either prompt or the last user message
     last_user_msg = None
     if body.messages:
@@ -43,7 +24,8 @@ async def chat(body: schemas.ChatIn, db: Session = Depends(get_db), user_id: int
     question_text = body.prompt or last_user_msg or ""
 
     # Build context with the real question so the date window is parsed
-    user_ctx = summarize_user(db, user_id, question=question_text)
+    user_ctx = await summarize_user_async(db, user_id, question=question_text)
+    await db.close()  # hand the connection back before the (slow) LLM call
     print("DEBUG USER CTX:\n", user_ctx)
     system = (
         "You are a supportive menstrual health assistant. "
@@ -1,14 +1,17 @@
 from __future__ import annotations
 from sqlalchemy.exc import IntegrityError
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
+from bisect import bisect_right
 from datetime import date, timedelta
-from typing import Optional
+from typing import Literal, Optional
 from pydantic import BaseModel
 from db import get_db
 import models
 from .deps import get_current_user_id
+from .pagination import keyset_page, MAX_PAGE_SIZE
+from .insights import rebuild_user_insights
 
 router = APIRouter(prefix="/cycles")
 
@@ -30,6 +33,8 @@ def _commit_or_translate(db: Session, entity):
     """Commit and translate common constraint violations into clear HTTP errors."""
     try:
         db.add(entity)
+        db.flush()
+        rebuild_user_insights(db, entity.user_id)
         db.commit()
         db.refresh(entity)
         return entity
@@ -53,10 +58,66 @@ def _validate_policy_2(start_date: date | None, end_date: date | None):
     if start_date is not None and end_date < start_date:
         raise HTTPException(422, detail="End date must be on or after start date.")
 
+def check_cycle_batch(db: Session, user_id: int, cycles: list[CycleCreate]) -> tuple[list[int], list[dict]]:
+    """
+    Validate a whole batch against Policy 2, cycle_exact_unique and
+    cycle_no_overlap in one pass (one SELECT for the existing cycles it could
+    collide with). Returns (indexes of accepted rows, per-row errors).
+    """
+    errors: list[dict] = []
+    valid: list[int] = []
+    for i, c in enumerate(cycles):
+        try:
+            _validate_policy_2(c.start_date, c.end_date)
+        except HTTPException as e:
+            errors.append({"index": i, "detail": e.detail})
+            continue
+        valid.append(i)
+    if not valid:
+        return [], errors
+
+    lo = min(cycles[i].start_date for i in valid)
+    hi = max(cycles[i].end_date for i in valid)
+    existing = (
+        db.query(models.CycleLog.start_date, models.CycleLog.end_date)
+          .filter(models.CycleLog.user_id == user_id,
+                  models.CycleLog.start_date <= hi,
+                  models.CycleLog.end_date >= lo)
+          .order_by(models.CycleLog.start_date.asc())
+          .all()
+    )
+    # Existing rows never overlap each other (DB constraint), so the one with the
+    # greatest start <= candidate end is the only one that can reach into it.
+    ex_starts = [r.start_date for r in existing]
+    ex_exact = {(r.start_date, r.end_date) for r in existing}
+
+    accepted: list[int] = []
+    max_end: date | None = None
+    for i in sorted(valid, key=lambda i: (cycles[i].start_date, cycles[i].end_date)):
+        c = cycles[i]
+        if (c.start_date, c.end_date) in ex_exact:
+            errors.append({"index": i, "detail": "This cycle already exists for the user."})
+            continue
+        j = bisect_right(ex_starts, c.end_date) - 1
+        if (j >= 0 and existing[j].end_date >= c.start_date) or (max_end and c.start_date <= max_end):
+            errors.append({"index": i, "detail": "This cycle overlaps an existing one."})
+            continue
+        accepted.append(i)
+        max_end = c.end_date
+
+    errors.sort(key=lambda e: e["index"])
+    return sorted(accepted), errors
+
 # ----- Routes -----
 @router.get("/")
 def list_cycles(
+    response: Response,
     month: str | None = None,
+    date_from: date | None = Query(None, alias="from"),
+    date_to: date | None = Query(None, alias="to"),
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["asc", "desc"] = "asc",
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
@@ -70,7 +131,15 @@ def list_cycles(
             models.CycleLog.start_date <= last,
             or_(models.CycleLog.end_date.is_(None), models.CycleLog.end_date >= first),
         )
-    return q.order_by(models.CycleLog.start_date.asc()).all()
+    # from/to select cycles overlapping the range, same as the month filter
+    if date_to:
+        q = q.filter(models.CycleLog.start_date <= date_to)
+    if date_from:
+        q = q.filter(or_(models.CycleLog.end_date.is_(None), models.CycleLog.end_date >= date_from))
+    return keyset_page(
+        q, models.CycleLog.start_date, models.CycleLog.id, response,
+        cursor=cursor, limit=limit, order=order,
+    )
 
 @router.post("/", status_code=201)
 def create_cycle(
@@ -113,6 +182,8 @@ def update_cycle(
     _validate_policy_2(c.start_date, c.end_date)
 
     try:
+        db.flush()
+        rebuild_user_insights(db, user_id)
         db.commit()
         db.refresh(c)
         return c
@@ -138,5 +209,10 @@ def delete_cycle(
     if not c:
         raise HTTPException(404, detail="Cycle not found")
     db.delete(c)
+    db.flush()
+    if not db.query(models.CycleLog.id).filter_by(user_id=user_id).first():
+        # nothing left to predict from; don't wait for the nightly job
+        db.query(models.CyclePrediction).filter_by(user_id=user_id).delete(synchronize_session=False)
+    rebuild_user_insights(db, user_id)
     db.commit()
     return {"detail": "Deleted"}
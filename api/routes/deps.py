@@ -4,10 +4,30 @@ from jose import jwt, JWTError, ExpiredSignatureError
 import os
 from sqlalchemy.orm import Session
 from db import get_db
+from cache import cache_get, cache_set, cache_add
 import models
 
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
 ALGORITHM = "HS256"
+# How long a verified (user_id -> token_version) pair is trusted without hitting Postgres
+IDENTITY_CACHE_TTL = int(os.getenv("IDENTITY_CACHE_TTL", "300"))
+
+# Cached in place of a token_version once the account is deleted; real versions are >= 0
+_DELETED = "-1"
+
+def _identity_key(user_id: int) -> str:
+    return f"auth:user:{user_id}"
+
+def invalidate_identity(user_id: int, token_version: int | None = None):
+    """
+    Called after token_version changes (pass the new value) or the user is
+    deleted (None). The new value is written unconditionally, while the cold
+    path in get_current_user_id only adds a missing entry. A cold request that
+    read the old version from Postgres before this commit therefore can't
+    overwrite it, whichever of the two writes lands first.
+    """
+    value = _DELETED if token_version is None else str(token_version)
+    cache_set(_identity_key(user_id), value, IDENTITY_CACHE_TTL)
 
 def get_current_user_id(
     authorization: str | None = Header(None),
@@ -30,6 +50,16 @@ def get_current_user_id(
     if not sub:
         raise HTTPException(status_code=401, detail="Invalid token")
     user_id = int(sub)
+    token_tv = int(payload.get("tv", 0))
+
+    # Warm path: token_version comes from the identity cache, no DB round-trip
+    cached_tv = cache_get(_identity_key(user_id))
+    if cached_tv is not None:
+        if cached_tv == _DELETED:
+            raise HTTPException(status_code=401, detail="User not found")
+        if int(cached_tv) != token_tv:
+            raise HTTPException(status_code=401, detail="Session expired. Please log in again.")
+        return user_id
 
     # Load user
     user = db.query(models.User).filter(models.User.id == user_id).first()
@@ -37,8 +67,9 @@ def get_current_user_id(
         raise HTTPException(status_code=401, detail="User not found")
 
     # Token-version check (back-compat: missing column/claim => 0)
-    token_tv = int(payload.get("tv", 0))
     db_tv = int(getattr(user, "token_version", 0))
+    # Add-only: never replace a version written by invalidate_identity meanwhile
+    cache_add(_identity_key(user_id), str(db_tv), IDENTITY_CACHE_TTL)
     if db_tv != token_tv:
         raise HTTPException(status_code=401, detail="Session expired. Please log in again.")
 
@@ -48,7 +79,9 @@ def get_current_user(
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    # Session.get hits the identity map first, so a cold-path auth lookup in the
+    # same request is not repeated
+    user = db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     return user
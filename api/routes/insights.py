@@ -1,18 +1,28 @@
 from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import date
-from db import get_db
+from datetime import datetime
+from db import get_db, get_async_db
 import models
 from .deps import get_current_user_id
 from pydantic import BaseModel
 from typing import Dict
-import json, os, httpx
+import copy, hashlib, json, os
 
-from .phases import compute_phases
+from cache import cache_get, cache_set, user_generation, bump_user_generation
+from ollama_client import CHAT_MODEL, ollama_chat
+
+from .phases import compute_phases, PhaseIndex, FLOW_NAMES
 
 router = APIRouter(prefix="/insights")
 
 def compute_insights(cycles: list[models.CycleLog], logs: list[models.SymptomLog]) -> dict:
+    return compute_insights_with_index(cycles, logs)[0]
+
+def compute_insights_with_index(cycles: list[models.CycleLog], logs: list[models.SymptomLog]) -> tuple[dict, PhaseIndex]:
     spans = compute_phases(cycles, logs)
     lengths = []
     for i in range(len(cycles)-1):
@@ -21,62 +31,179 @@ def compute_insights(cycles: list[models.CycleLog], logs: list[models.SymptomLog
     avg_cycle = round(sum(lengths)/len(lengths)) if lengths else 28
     variability = (max(lengths)-min(lengths)) if len(lengths) >= 2 else 0
 
-    def label_for_date(d: date) -> str | None:
-        for s in spans:
-            if s["start"] <= d <= s["end"] if isinstance(s, dict) else (s.start <= d <= s.end):
-                return s["type"] if isinstance(s, dict) else s.type
-        return None
+    index = PhaseIndex(spans)
 
     by_phase: Dict[str, Dict[str, int]] = {}
     for lg in logs:
-        lab = label_for_date(lg.date)
+        lab = index.label(lg.date)
         if not lab: continue
         by_phase.setdefault(lab, {})
         name = getattr(lg, "symptom", "unknown")
         by_phase[lab][name] = by_phase[lab].get(name, 0) + 1
 
-    return {"average_cycle": avg_cycle, "variability_days": variability, "symptoms_by_phase": by_phase}
+    return {"average_cycle": avg_cycle, "variability_days": variability, "symptoms_by_phase": by_phase}, index
 
-@router.get("")
-def get_insights(db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+# ----- Materialized insights (user_insights) -----
+# The write paths keep one row per user current, so reads are a PK lookup.
+# Adding/removing a non-flow symptom only bumps a counter (labelled via the
+# stored phase segments); anything that can move phase boundaries (cycle
+# writes, flow-type symptoms, bulk changes) rebuilds that user's row.
+# Callers commit; these helpers only stage changes in the caller's transaction.
+
+def _row_payload(row: models.UserInsights) -> dict:
+    return {
+        "average_cycle": row.average_cycle,
+        "variability_days": row.variability_days,
+        "symptoms_by_phase": row.symptoms_by_phase,
+    }
+
+_SYMPTOMS_BY_SEGMENT_SQL = text("""
+    SELECT seg.label, l.symptom, count(*) AS n
+    FROM unnest(CAST(:starts AS date[]), CAST(:ends AS date[]), CAST(:labels AS text[])) AS seg(lo, hi, label)
+    JOIN symptom_logs l
+      ON l.user_id = :user_id AND l.date >= seg.lo AND l.date <= seg.hi
+    GROUP BY seg.label, l.symptom
+""")
+
+def symptoms_by_phase_sql(db: Session, user_id: int, index: PhaseIndex) -> Dict[str, Dict[str, int]]:
+    """
+    Count symptoms per phase inside Postgres. The segments are disjoint (overlaps
+    already resolved first-span-wins by PhaseIndex), so each log joins at most one
+    of them and the result matches compute_insights exactly. Each segment is a
+    range probe on idx_symptoms_user_date; only grouped counts come back.
+    """
+    by_phase: Dict[str, Dict[str, int]] = {}
+    if not index.labels:
+        return by_phase
+    rows = db.execute(_SYMPTOMS_BY_SEGMENT_SQL, {
+        "user_id": user_id, "starts": index.starts, "ends": index.ends, "labels": index.labels,
+    })
+    for label, symptom, n in rows:
+        by_phase.setdefault(label, {})[symptom] = n
+    return by_phase
+
+def load_insights(db: Session, user_id: int) -> tuple[dict, PhaseIndex]:
+    """compute_insights without hydrating every SymptomLog: only cycles and flow-type logs
+    (the inputs to phase boundaries) are loaded; per-phase counts are aggregated in SQL."""
     cycles = (db.query(models.CycleLog)
               .filter(models.CycleLog.user_id==user_id)
               .order_by(models.CycleLog.start_date.asc()).all())
-    logs = (db.query(models.SymptomLog).filter(models.SymptomLog.user_id==user_id).all())
-    return compute_insights(cycles, logs)
+    flow_logs = (db.query(models.SymptomLog.date, models.SymptomLog.symptom, models.SymptomLog.severity)
+                 .filter(models.SymptomLog.user_id==user_id,
+                         func.lower(models.SymptomLog.symptom).in_(FLOW_NAMES))
+                 .all())
+    data, index = compute_insights_with_index(cycles, flow_logs)
+    data["symptoms_by_phase"] = symptoms_by_phase_sql(db, user_id, index)
+    return data, index
+
+# Every cycle/symptom write goes through rebuild_user_insights or
+# apply_symptom_changes, so they also mark the user's derived caches (LLM
+# summaries, chat context) stale. The bump waits for the commit so a
+# concurrent reader can't re-cache pre-commit data under the new generation.
+def _invalidate_on_commit(db: Session, user_id: int):
+    db.info.setdefault("changed_users", set()).add(user_id)
+
+@event.listens_for(Session, "after_commit")
+def _bump_changed_users(session):
+    for uid in session.info.pop("changed_users", ()):
+        bump_user_generation(uid)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_users", None)
+
+def rebuild_user_insights(db: Session, user_id: int) -> dict:
+    _invalidate_on_commit(db, user_id)
+    db.flush()  # sessions don't autoflush; make pending writes visible to the recompute
+    data, index = load_insights(db, user_id)
+    values = {
+        "average_cycle": data["average_cycle"],
+        "variability_days": data["variability_days"],
+        "symptoms_by_phase": data["symptoms_by_phase"],
+        "phase_segments": index.to_dict(),
+        "updated_at": datetime.utcnow(),
+    }
+    db.execute(
+        pg_insert(models.UserInsights)
+        .values(user_id=user_id, **values)
+        .on_conflict_do_update(index_elements=[models.UserInsights.user_id], set_=values)
+    )
+    return data
+
+def _is_flow(symptom: str | None) -> bool:
+    return (symptom or "").lower() in FLOW_NAMES
+
+def apply_symptom_changes(db: Session, user_id: int, removed=(), added=()):
+    """Apply symptom log changes given as (date, symptom) pairs to the stored insights."""
+    _invalidate_on_commit(db, user_id)
+    if any(_is_flow(name) for _, name in [*removed, *added]):
+        rebuild_user_insights(db, user_id)
+        return
+    row = db.get(models.UserInsights, user_id, with_for_update=True, populate_existing=True)
+    if row is None:
+        rebuild_user_insights(db, user_id)
+        return
+    index = PhaseIndex.from_dict(row.phase_segments)
+    by_phase = copy.deepcopy(row.symptoms_by_phase)
+    for d, name in removed:
+        lab = index.label(d)
+        if lab and name in by_phase.get(lab, {}):
+            by_phase[lab][name] -= 1
+            if by_phase[lab][name] <= 0: del by_phase[lab][name]
+            if not by_phase[lab]: del by_phase[lab]
+    for d, name in added:
+        lab = index.label(d)
+        if not lab: continue
+        by_phase.setdefault(lab, {})
+        by_phase[lab][name] = by_phase[lab].get(name, 0) + 1
+    row.symptoms_by_phase = by_phase  # reassign so the JSON column is marked dirty
+
+@router.get("")
+def get_insights(db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+    row, pred = (db.query(models.UserInsights, models.CyclePrediction)
+                   .outerjoin(models.CyclePrediction, models.CyclePrediction.user_id == models.UserInsights.user_id)
+                   .filter(models.UserInsights.user_id == user_id)
+                   .first()) or (None, None)
+    if row is not None:
+        data = _row_payload(row)
+    else:
+        # First read for this user (not backfilled yet): build and keep it
+        data = rebuild_user_insights(db, user_id)
+        db.commit()
+        pred = db.get(models.CyclePrediction, user_id)
+    # Filled nightly by predict_cycles.py
+    data["next_period_start"] = pred.next_period_start if pred else None
+    data["avg_cycle_length_days"] = pred.median_cycle_days if pred else None
+    return data
 
 class LLMRequest(BaseModel):
     system: str | None = None
     user_prompt: str | None = None
 
-# minimal Ollama chat to avoid depending on rag.py
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
-CHAT_MODEL = os.getenv("CHAT_MODEL", "llama3.1")
-
-async def _ollama_chat(system: str, user: str) -> str:
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={"model": CHAT_MODEL, "messages": [
-                {"role":"system","content": system},
-                {"role":"user","content": user}
-            ], "stream": False},
-        )
-        r.raise_for_status()
-        data = r.json()
-        # Support both message/content and response shapes
-        msg = (data.get("message") or {}).get("content") or data.get("response") or ""
-        return msg.strip()
+# ----- LLM summary cache -----
+# Entries are keyed on a hash of everything that shapes the answer (insights
+# JSON, both prompts, model) plus the user's data generation, which every
+# data write rotates. The cache client is sync, so lookups go through the
+# threadpool rather than blocking the event loop.
+LLM_SUMMARY_TTL = int(os.getenv("LLM_SUMMARY_TTL", str(24 * 3600)))
+
+def _summary_key(user_id: int, data: dict, system: str, user_prompt: str) -> str:
+    gen = user_generation(user_id)
+    h = hashlib.sha256()
+    for part in (CHAT_MODEL, system, user_prompt, json.dumps(data, sort_keys=True, default=str)):
+        h.update(part.encode())
+        h.update(b"\0")
+    return f"llm:summary:{user_id}:{gen}:{h.hexdigest()}"
 
 @router.post("/llm")
-async def summarize_with_llm(body: LLMRequest, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
-    cycles = (db.query(models.CycleLog)
-              .filter(models.CycleLog.user_id==user_id)
-              .order_by(models.CycleLog.start_date.asc()).all())
-    logs = (db.query(models.SymptomLog)
-            .filter(models.SymptomLog.user_id==user_id)
-            .all())
-    data = compute_insights(cycles, logs)
+async def summarize_with_llm(body: LLMRequest, db: AsyncSession = Depends(get_async_db), user_id: int = Depends(get_current_user_id)):
+    row = await db.get(models.UserInsights, user_id)
+    if row is not None:
+        data = _row_payload(row)
+    else:
+        data = await db.run_sync(rebuild_user_insights, user_id)
+        await db.commit()
+    await db.close()  # hand the connection back before the (slow) LLM call
 
     default_system = (
         "You are a supportive menstrual health assistant. "
@@ -95,9 +222,15 @@ async def summarize_with_llm(body: LLMRequest, db: Session = Depends(get_db), us
     system = body.system or default_system
     user_prompt = body.user_prompt or default_user
 
+    key = await run_in_threadpool(_summary_key, user_id, data, system, user_prompt)
+    summary = await run_in_threadpool(cache_get, key)
+    if summary is not None:
+        return {"summary": summary, "data": data, "cached": True}
+
     try:
-        summary = await _ollama_chat(system, user_prompt)
+        summary = await ollama_chat(system, user_prompt)
     except Exception as e:
         return {"detail": f"LLM call failed: {str(e)}", "data": data}
 
-    return {"summary": summary, "data": data}
+    await run_in_threadpool(cache_set, key, summary, LLM_SUMMARY_TTL)
+    return {"summary": summary, "data": data, "cached": False}
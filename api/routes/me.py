@@ -1,50 +1,159 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from typing import Any, Dict, List
 from db import get_db
-from routes.deps import get_current_user_id
-import models
-from security import verify_password, hash_password
+from export import ExportFormat, iter_export, export_filename, export_media_type
+import export_jobs
+from routes.deps import get_current_user_id, invalidate_identity
+from cache import bump_user_generation
+from routes.cycles import CycleCreate, check_cycle_batch
+from routes.symptoms import SymptomCreate
+from routes.insights import rebuild_user_insights
+import models, os
+from security import verify_password_async, hash_password_async
 
 router = APIRouter(prefix="/me", tags=["me"])
 
+MAX_IMPORT_ROWS = int(os.getenv("MAX_IMPORT_ROWS", "20000"))
+
 class ChangePasswordIn(BaseModel):
     current_password: str = Field(min_length=8)
     new_password: str = Field(min_length=8)
 
+class ImportIn(BaseModel):
+    # Raw dicts so one malformed row is reported instead of failing the batch
+    cycles: List[Dict[str, Any]] = []
+    symptoms: List[Dict[str, Any]] = []
+
+def _parse_rows(rows: List[Dict[str, Any]], schema) -> tuple[list, list[int], list[dict]]:
+    parsed, idx, errors = [], [], []
+    for i, row in enumerate(rows):
+        try:
+            parsed.append(schema(**row))
+            idx.append(i)
+        except (ValidationError, TypeError) as e:
+            msg = e.errors()[0]["msg"] if isinstance(e, ValidationError) else str(e)
+            errors.append({"index": i, "detail": msg})
+    return parsed, idx, errors
+
 @router.get("/export")
 def export_my_data(
-    db: Session = Depends(get_db),
+    format: ExportFormat = "json",
+    gzip: bool = False,
     user_id: int = Depends(get_current_user_id)
 ):
-    cycles = (
-        db.query(models.CycleLog)
-          .filter(models.CycleLog.user_id == user_id)
-          .order_by(models.CycleLog.start_date.asc())
-          .all()
+    """
+    Streamed export (json, ndjson or csv, optionally gzipped). Chunks are sent
+    as rows come off a server-side cursor, so memory doesn't grow with history.
+    """
+    return StreamingResponse(
+        iter_export(user_id, format, gzip),
+        media_type=export_media_type(format, gzip),
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(format, gzip)}"'},
     )
-    symptoms = (
-        db.query(models.SymptomLog)
-          .filter(models.SymptomLog.user_id == user_id)
-          .order_by(models.SymptomLog.date.asc())
-          .all()
+
+@router.post("/export/jobs", status_code=202)
+def start_export_job(
+    format: ExportFormat = "ndjson",
+    gzip: bool = True,
+    user_id: int = Depends(get_current_user_id),
+):
+    """Queue an export for export_worker.py; poll GET /me/export/jobs/{job_id} for the link."""
+    try:
+        job_id = export_jobs.enqueue_export(user_id, format, gzip)
+    except RuntimeError as e:
+        raise HTTPException(503, detail=str(e))
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/export/jobs/{job_id}")
+def get_export_job(
+    job_id: str,
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+):
+    try:
+        job = export_jobs.get_job(job_id)
+    except RuntimeError as e:
+        raise HTTPException(503, detail=str(e))
+    if not job or job.get("user_id") != str(user_id):
+        raise HTTPException(404, detail="Export job not found")
+    out = {"job_id": job_id, "status": job["status"]}
+    if job["status"] == "done":
+        out["download_url"] = export_jobs.download_url(job_id, job, str(request.base_url))
+        out["expires_in"] = export_jobs.EXPORT_LINK_TTL
+    elif job["status"] == "failed":
+        out["detail"] = "Export failed. Please try again."
+    return out
+
+@router.get("/export/jobs/{job_id}/download")
+def download_export(job_id: str, expires: int, sig: str):
+    """Local-storage download; authorised by the signed link instead of a bearer token."""
+    if not export_jobs.verify_download(job_id, expires, sig):
+        raise HTTPException(403, detail="This download link is invalid or has expired.")
+    job = export_jobs.get_job(job_id)
+    if not job or job.get("status") != "done":
+        raise HTTPException(404, detail="Export not found")
+    fmt, compress = job["format"], job["gzip"] == "1"
+    return FileResponse(
+        export_jobs.local_path(job),
+        media_type=export_media_type(fmt, compress),
+        filename=export_filename(fmt, compress),
     )
+
+def _purge_exports(user_id: int):
+    # Export files are copies of the data being deleted and must not outlive it.
+    # Runs first so a storage outage fails the request before anything is gone.
+    try:
+        export_jobs.purge_user_exports(user_id)
+    except Exception as e:
+        raise HTTPException(503, detail="Your exports could not be removed, so nothing was deleted. Please retry.") from e
+
+@router.post("/import")
+def import_my_data(
+    body: ImportIn,
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """
+    Bulk import (e.g. from another tracking app). Invalid rows are skipped and
+    reported by index; valid rows are written with one multi-row INSERT per
+    table in a single transaction.
+    """
+    if len(body.cycles) + len(body.symptoms) > MAX_IMPORT_ROWS:
+        raise HTTPException(413, detail=f"Import is limited to {MAX_IMPORT_ROWS} rows per request.")
+
+    cycles, cycle_idx, cycle_errors = _parse_rows(body.cycles, CycleCreate)
+    accepted, batch_errors = check_cycle_batch(db, user_id, cycles)
+    # map batch positions back to the caller's row indexes
+    cycle_errors += [{**e, "index": cycle_idx[e["index"]]} for e in batch_errors]
+    cycle_rows = [
+        {"user_id": user_id, **cycles[i].dict()}
+        for i in accepted
+    ]
+
+    symptoms, _, symptom_errors = _parse_rows(body.symptoms, SymptomCreate)
+    symptom_rows = [{"user_id": user_id, **s.dict()} for s in symptoms]
+
+    try:
+        if cycle_rows:
+            db.execute(insert(models.CycleLog), cycle_rows)
+        if symptom_rows:
+            db.execute(insert(models.SymptomLog), symptom_rows)
+        rebuild_user_insights(db, user_id)
+        db.commit()
+    except IntegrityError:
+        # A concurrent write slipped in between the overlap check and the insert
+        db.rollback()
+        raise HTTPException(409, detail="Your cycles changed during import. Please retry.")
+
     return {
-        "cycles": [
-            {"id": c.id, "start_date": c.start_date.isoformat()}
-            for c in cycles
-        ],
-        "symptoms": [
-            {
-                "id": s.id,
-                "date": s.date.isoformat(),
-                "symptom": s.symptom,
-                "severity": getattr(s, "severity", None),
-                "tags": getattr(s, "tags", None),
-                "notes": getattr(s, "notes", None),
-            }
-            for s in symptoms
-        ],
+        "cycles": {"imported": len(cycle_rows), "errors": sorted(cycle_errors, key=lambda e: e["index"])},
+        "symptoms": {"imported": len(symptom_rows), "errors": symptom_errors},
     }
 
 @router.delete("/data")
@@ -52,23 +161,26 @@ def delete_my_data(
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id)
 ):
+    _purge_exports(user_id)
     # Delete children explicitly (safe regardless of FK ondelete policy)
     db.query(models.SymptomLog).filter(models.SymptomLog.user_id == user_id).delete(synchronize_session=False)
     db.query(models.CycleLog).filter(models.CycleLog.user_id == user_id).delete(synchronize_session=False)
+    db.query(models.CyclePrediction).filter(models.CyclePrediction.user_id == user_id).delete(synchronize_session=False)
+    rebuild_user_insights(db, user_id)
     db.commit()
     return {"ok": True}
 
 @router.patch("/password")
-def change_password(
+async def change_password(
     body: ChangePasswordIn,
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await run_in_threadpool(db.get, models.User, user_id)
     if not user:
         raise HTTPException(404, "User not found")
 
-    if not verify_password(body.current_password, user.password_hash):
+    if not await verify_password_async(body.current_password, user.password_hash):
         raise HTTPException(401, "Current password is incorrect")
 
     # Basic policy (adjust to your needs)
@@ -77,11 +189,13 @@ def change_password(
     if len(body.new_password) < 8:
         raise HTTPException(422, "New password must be at least 8 characters")
 
-    user.password_hash = hash_password(body.new_password)
+    user.password_hash = await hash_password_async(body.new_password)
     # Invalidate existing JWTs by bumping token_version
-    user.token_version = (user.token_version or 0) + 1
+    new_tv = (user.token_version or 0) + 1
+    user.token_version = new_tv
     db.add(user)
-    db.commit()
+    await run_in_threadpool(db.commit)
+    invalidate_identity(user_id, new_tv)
     return {"ok": True}
 
 @router.delete("")
@@ -89,12 +203,17 @@ def delete_account(
     db: Session = Depends(get_db),
     user_id: int = Depends(get_current_user_id),
 ):
+    _purge_exports(user_id)
     # Delete child records explicitly (safe regardless of FK ondelete policy)
     db.query(models.SymptomLog).filter(models.SymptomLog.user_id == user_id).delete(synchronize_session=False)
     db.query(models.CycleLog).filter(models.CycleLog.user_id == user_id).delete(synchronize_session=False)
+    db.query(models.UserInsights).filter(models.UserInsights.user_id == user_id).delete(synchronize_session=False)
+    db.query(models.CyclePrediction).filter(models.CyclePrediction.user_id == user_id).delete(synchronize_session=False)
     # Finally delete the user
     deleted = db.query(models.User).filter(models.User.id == user_id).delete(synchronize_session=False)
     db.commit()
+    bump_user_generation(user_id)
+    invalidate_identity(user_id)
     if not deleted:
         raise HTTPException(404, "User not found")
     return {"ok": True}
@@ -0,0 +1,58 @@
+from __future__ import annotations
+import base64
+from datetime import date
+from typing import Literal
+from fastapi import HTTPException, Response
+from sqlalchemy import tuple_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(d: date, row_id: int) -> str:
+    raw = f"{d.isoformat()}:{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        d, row_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return date.fromisoformat(d), int(row_id)
+    except Exception:
+        raise HTTPException(422, detail="Invalid cursor.")
+
+def keyset_page(
+    q,
+    date_col,
+    id_col,
+    response: Response,
+    cursor: str | None = None,
+    limit: int | None = None,
+    order: Literal["asc", "desc"] = "asc",
+):
+    """
+    Order `q` by (date, id) and, when paging is requested, return one page plus
+    an X-Next-Cursor header. Seeking on the (date, id) tuple keeps every page on
+    the (user_id, date) indexes instead of an OFFSET scan over the whole history.
+    Without `cursor`/`limit` the full ordered list is returned (legacy behaviour).
+    """
+    if cursor:
+        cd, cid = decode_cursor(cursor)
+        key = tuple_(date_col, id_col)
+        q = q.filter(key < tuple_(cd, cid) if order == "desc" else key > tuple_(cd, cid))
+        limit = limit or DEFAULT_PAGE_SIZE
+
+    if order == "desc":
+        q = q.order_by(date_col.desc(), id_col.desc())
+    else:
+        q = q.order_by(date_col.asc(), id_col.asc())
+
+    if limit is None:
+        return q.all()
+
+    rows = q.limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, date_col.key), last.id)
+    return rows
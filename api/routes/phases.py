@@ -6,6 +6,8 @@ from db import get_db
 import models
 from .deps import get_current_user_id
 from dataclasses import dataclass
+from bisect import bisect_left, bisect_right
+import heapq
 
 router = APIRouter()
 
@@ -15,6 +17,59 @@ class PhaseSpan:
     start: date
     end: date
 
+class PhaseIndex:
+    """
+    Sorted, array-backed interval index over phase spans for O(log n) lookups.
+    Spans may overlap (e.g. a short cycle's ovulation window reaching into
+    menstruation); like a linear scan, the span that comes first wins. We flatten
+    them into disjoint segments once, then bisect on segment starts.
+    """
+
+    def __init__(self, spans: list[PhaseSpan]):
+        self.starts: list[date] = []
+        self.ends: list[date] = []
+        self.labels: list[str] = []
+        if not spans:
+            return
+        bounds = sorted({s.start for s in spans} | {s.end + timedelta(days=1) for s in spans})
+        by_start = sorted(range(len(spans)), key=lambda i: spans[i].start)
+        active: list[int] = []  # heap of span indexes (priority = list order)
+        j = 0
+        for lo, hi in zip(bounds, bounds[1:]):
+            while j < len(by_start) and spans[by_start[j]].start <= lo:
+                heapq.heappush(active, by_start[j]); j += 1
+            while active and spans[active[0]].end < lo:
+                heapq.heappop(active)
+            if not active:
+                continue
+            label = spans[active[0]].type
+            seg_end = hi - timedelta(days=1)
+            if self.labels and self.labels[-1] == label and self.ends[-1] + timedelta(days=1) == lo:
+                self.ends[-1] = seg_end
+            else:
+                self.starts.append(lo); self.ends.append(seg_end); self.labels.append(label)
+
+    def to_dict(self) -> dict:
+        return {
+            "starts": [d.isoformat() for d in self.starts],
+            "ends": [d.isoformat() for d in self.ends],
+            "labels": list(self.labels),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PhaseIndex":
+        idx = cls([])
+        idx.starts = [date.fromisoformat(d) for d in data.get("starts", [])]
+        idx.ends = [date.fromisoformat(d) for d in data.get("ends", [])]
+        idx.labels = list(data.get("labels", []))
+        return idx
+
+    def label(self, d: date) -> str | None:
+        i = bisect_right(self.starts, d) - 1
+        if i >= 0 and d <= self.ends[i]:
+            return self.labels[i]
+        return None
+
 def _median(vals: list[int]) -> int:
     if not vals: return 28
     s = sorted(vals); n = len(s)
@@ -27,31 +82,53 @@ def estimate_lengths(cycles: list[models.CycleLog]) -> tuple[int, int]:
         if d > 10: lengths.append(d)
     return (_median(lengths) if lengths else 28, 14)
 
-def menstruation_end(cycle: models.CycleLog, logs: list[models.SymptomLog]) -> date:
-    flow_names = {"flow","bleeding","period","spotting"}
-    flow_days = sorted([
+FLOW_NAMES = {"flow", "bleeding", "period", "spotting"}
+
+def flow_day_index(logs: list[models.SymptomLog]) -> list[date]:
+    """Sorted, de-duplicated dates of the user's flow-type logs (built once per request)."""
+    return sorted({
         lg.date for lg in logs
-        if lg.date >= cycle.start_date and (not cycle.end_date or lg.date <= cycle.end_date)
-        and (lg.symptom or "").lower() in flow_names and (lg.severity or 1) > 0
-    ])
-    if flow_days:
-        last = cycle.start_date
-        for d in flow_days:
-            if (d - last).days <= 1: last = d
-            else: break
-        return last
-    return cycle.start_date + timedelta(days=4)
+        if (lg.symptom or "").lower() in FLOW_NAMES and (lg.severity or 1) > 0
+    })
+
+def menstruation_ends(cycles: list[models.CycleLog], flow_days: list[date]) -> list[date]:
+    """
+    Menstruation end for each cycle (sorted by start_date) in one merge pass over
+    `flow_days`: the last day of the run of consecutive flow days starting at the
+    cycle start, or start + 4 days when the cycle has no flow logs at all.
+    """
+    out: list[date] = []
+    p = 0
+    for c in cycles:
+        p = bisect_left(flow_days, c.start_date, lo=p)
+        if p < len(flow_days) and (not c.end_date or flow_days[p] <= c.end_date):
+            last = c.start_date
+            j = p
+            while j < len(flow_days):  # walk in place; slicing would copy the tail per cycle
+                d = flow_days[j]
+                if (c.end_date and d > c.end_date) or (d - last).days > 1:
+                    break
+                last = d
+                j += 1
+            out.append(last)
+        else:
+            out.append(c.start_date + timedelta(days=4))
+    return out
+
+def menstruation_end(cycle: models.CycleLog, logs: list[models.SymptomLog]) -> date:
+    return menstruation_ends([cycle], flow_day_index(logs))[0]
 
 def compute_phases(cycles: list[models.CycleLog], logs: list[models.SymptomLog]) -> list[PhaseSpan]:
     if not cycles: return []
     cs = sorted(cycles, key=lambda c: c.start_date)
     avg_cycle, luteal_len = estimate_lengths(cs)
+    mens_ends = menstruation_ends(cs, flow_day_index(logs))
     out: list[PhaseSpan] = []
 
     for i, c in enumerate(cs):
         next_start = cs[i+1].start_date if i+1 < len(cs) else None
         end = (next_start - timedelta(days=1)) if next_start else (c.end_date or (c.start_date + timedelta(days=avg_cycle-1)))
-        mens_end = menstruation_end(c, logs)
+        mens_end = mens_ends[i]
         out.append(PhaseSpan("menstruation", c.start_date, mens_end))
 
         cycle_len = (end - c.start_date).days + 1
@@ -1,118 +1,225 @@
-import os
-from typing import List
+import asyncio, hashlib, os
+from typing import Iterator
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from db import get_db
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 from routes.deps import get_current_user_id
-from neo4j import GraphDatabase
-from user_context import summarize_user
-import httpx
+from neo4j import AsyncDriver, AsyncGraphDatabase, Query
+from user_context import summarize_user_async
 import schemas
 from pydantic import BaseModel
-import httpx
-import os
-import schemas
+from ollama_client import EMBED_MODEL, ollama_embed, ollama_chat
+import vector_index
 
 router = APIRouter()
 NEO4J_URI = os.getenv("NEO4J_URI", "bolt://neo4j:7687")
 NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
 NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "password123")
-OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
-CHAT_MODEL = os.getenv("CHAT_MODEL", "qwen2.5:1.5b-instruct")
-EMBED_MODEL = os.getenv("EMBED_MODEL", "nomic-embed-text:latest")
-
-driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
-
-
-async def ollama_embed(texts: List[str]) -> List[List[float]]:
-    async with httpx.AsyncClient(timeout=60) as client:
-        out = []
-        for t in texts:
-            r = await client.post(f"{OLLAMA_BASE_URL}/api/embeddings", json={"model": EMBED_MODEL, "prompt": t})
-            r.raise_for_status()
-            out.append(r.json()["embedding"])
-        return out
-
-async def ollama_chat(system: str, user: str) -> str:
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={
-                "model": CHAT_MODEL,
-                "messages": [
-                    {"role":"system","content": system},
-                    {"role":"user","content": user}
-                ],
-                "stream": False
-            },
-        )
-        r.raise_for_status()
-        data = r.json()
-        msg = data.get("message", {}).get("content", "")
-        # Some builds return "message" as a list of chunks; handle both:
-        if isinstance(msg, str) and msg:
-            return msg.strip()
-        if "message" in data and isinstance(data["message"], dict):
-            return data["message"].get("content","").strip()
-        return data.get("response","").strip()
-
-async def ollama_chat_messages(messages: list[dict]) -> str:
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.post(
-            f"{OLLAMA_BASE_URL}/api/chat",
-            json={"model": CHAT_MODEL, "messages": messages, "stream": False},
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_ACQUIRE_TIMEOUT = float(os.getenv("NEO4J_ACQUIRE_TIMEOUT", "10"))  # waiting for a pooled connection
+NEO4J_CONNECT_TIMEOUT = float(os.getenv("NEO4J_CONNECT_TIMEOUT", "5"))
+NEO4J_QUERY_TIMEOUT = float(os.getenv("NEO4J_QUERY_TIMEOUT", "10"))      # /ask retrieval and index loads
+NEO4J_INGEST_TIMEOUT = float(os.getenv("NEO4J_INGEST_TIMEOUT", "300"))   # the /ingest write transaction
+NEO4J_INDEX_LOAD_TIMEOUT = float(os.getenv("NEO4J_INDEX_LOAD_TIMEOUT", "120"))  # reading every chunk for the local index
+
+_driver: AsyncDriver | None = None
+
+def get_driver() -> AsyncDriver:
+    """Async Bolt driver with its own connection pool; created in the app lifespan, closed on shutdown."""
+    global _driver
+    if _driver is None:
+        _driver = AsyncGraphDatabase.driver(
+            NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD),
+            max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+            connection_acquisition_timeout=NEO4J_ACQUIRE_TIMEOUT,
+            connection_timeout=NEO4J_CONNECT_TIMEOUT,
         )
-        r.raise_for_status()
-        data = r.json()
-        msg = data.get("message", {}).get("content", "") or data.get("response", "")
-        return (msg or "").strip()
-
-def ensure_vector_index(session, dim: int):
-    session.run("""
-        CREATE VECTOR INDEX guideline_embed_idx IF NOT EXISTS
-        FOR (g:Guideline) ON (g.embedding)
+    return _driver
+
+async def close_driver():
+    global _driver
+    if _driver is not None:
+        await _driver.close()
+        _driver = None
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "500"))  # rows per UNWIND statement
+# Guidelines are retrieved by passage: each is split into overlapping chunks
+# (characters, cut at sentence/word boundaries) stored as (:Chunk)-[:PART_OF]->(:Guideline)
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "800"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "120"))
+
+_schema_ready = False
+
+async def ensure_vector_index(session, dim: int):
+    await session.run("""
+        CREATE VECTOR INDEX chunk_embed_idx IF NOT EXISTS
+        FOR (c:Chunk) ON (c.embedding)
         OPTIONS { indexConfig: { `vector.dimensions`: $dim, `vector.similarity_function`: 'cosine' } }
     """, dim=dim)
 
+async def _ensure_schema(session, dim: int):
+    """Vector index plus a url constraint (keeps MERGE an index lookup); once per process."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    await session.run("CREATE CONSTRAINT guideline_url IF NOT EXISTS FOR (g:Guideline) REQUIRE g.url IS UNIQUE")
+    await ensure_vector_index(session, dim)
+    _schema_ready = True
+
+def content_hash(doc: schemas.IngestDoc) -> str:
+    # Model and chunking settings are part of the hash so changing them re-chunks and re-embeds
+    key = "\0".join((EMBED_MODEL, str(CHUNK_SIZE), str(CHUNK_OVERLAP), doc.title, doc.text))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+def iter_chunks(text: str, size: int | None = None, overlap: int | None = None) -> Iterator[str]:
+    """Yield overlapping windows of ~`size` chars, preferring to cut after a sentence, else at a space."""
+    size = size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if overlap is None else overlap
+    text = " ".join(text.split())
+    start = 0
+    while start < len(text):
+        end = min(start + size, len(text))
+        if end < len(text):
+            cut = text.rfind(". ", start + size // 2, end)
+            if cut != -1:
+                end = cut + 1
+            else:
+                cut = text.rfind(" ", start + size // 2, end)
+                end = cut if cut != -1 else end
+        yield text[start:end].strip()
+        if end >= len(text):
+            break
+        nxt = max(end - overlap, start + 1)
+        space = text.find(" ", nxt, end)  # don't start the next chunk mid-word
+        start = space + 1 if space != -1 else nxt
+
+def _iter_chunk_batches(docs: list[schemas.IngestDoc]) -> Iterator[list[dict]]:
+    batch = []
+    for d in docs:
+        for i, chunk in enumerate(iter_chunks(d.text)):
+            batch.append({"url": d.url, "idx": i, "text": chunk})
+            if len(batch) >= INGEST_BATCH_SIZE:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+async def _upsert_guidelines(tx, docs: list[dict]):
+    """Write guideline nodes and drop their old chunks (rewritten afterwards)."""
+    for i in range(0, len(docs), INGEST_BATCH_SIZE):
+        await tx.run("""
+            UNWIND $docs AS doc
+            MERGE (g:Guideline {url: doc.url})
+            SET g.title = doc.title, g.text = doc.text, g.content_hash = doc.content_hash
+            REMOVE g.embedding
+            WITH g
+            OPTIONAL MATCH (old:Chunk)-[:PART_OF]->(g)
+            DETACH DELETE old
+        """, docs=docs[i:i + INGEST_BATCH_SIZE])
+
+async def _write_chunks(tx, rows: list[dict]):
+    await tx.run("""
+        UNWIND $rows AS row
+        MATCH (g:Guideline {url: row.url})
+        CREATE (c:Chunk {idx: row.idx, text: row.text, embedding: row.embedding})-[:PART_OF]->(g)
+    """, rows=rows)
+
 @router.post("/ingest")
 async def ingest(inp: schemas.IngestIn):
+    """
+    Upsert guidelines by url. Docs whose content hash matches the stored node are
+    skipped (no embedding, no write); the rest are chunked and embedded
+    first, then written with UNWIND in one short transaction, so no locks
+    are held while the model runs. Guidelines missing from
+    the payload are left alone; removing them is an operator task
+    (prune_guidelines.py).
+    """
     if not inp.docs:
         raise HTTPException(400, "No docs provided")
-    texts = [d.text for d in inp.docs]
-    embeds = await ollama_embed(texts)
-    with driver.session() as session:
-        ensure_vector_index(session, len(embeds[0]))
-        for d, e in zip(inp.docs, embeds):
-            session.run("""
-                MERGE (g:Guideline {url:$url})
-                SET g.title=$title, g.text=$text, g.embedding=$emb
-            """, url=d.url, title=d.title, text=d.text, emb=e)
-    return {"ingested": len(inp.docs)}
+    docs = {d.url: d for d in inp.docs}  # last occurrence of a url wins
+    hashes = {url: content_hash(d) for url, d in docs.items()}
+    async with get_driver().session() as session:
+        res = await session.run(Query(
+            "MATCH (g:Guideline) WHERE g.url IN $urls RETURN g.url AS url, g.content_hash AS h",
+            timeout=NEO4J_QUERY_TIMEOUT), urls=list(docs))
+        stored = {r["url"]: r["h"] async for r in res}
+    changed = [d for url, d in docs.items() if stored.get(url) != hashes[url]]
+
+    # ollama_embed batches and parallelizes internally (and hits the embedding cache)
+    batches = list(_iter_chunk_batches(changed))
+    rows = [r for b in batches for r in b]
+    for row, e in zip(rows, await ollama_embed([r["text"] for r in rows])):
+        row["embedding"] = e
+    chunks = len(rows)
+    async with get_driver().session() as session:
+        if batches:
+            await _ensure_schema(session, len(batches[0][0]["embedding"]))  # schema changes can't share the write tx
+        async with await session.begin_transaction(timeout=NEO4J_INGEST_TIMEOUT) as tx:
+            await _upsert_guidelines(tx, [{"url": d.url, "title": d.title, "text": d.text,
+                                     "content_hash": hashes[d.url]} for d in changed])
+            for batch in batches:
+                await _write_chunks(tx, batch)
+            await tx.commit()
+    if changed:
+        version = await run_in_threadpool(vector_index.bump_version)
+        if vector_index.LOCAL_VECTOR_INDEX:
+            await load_local_index(version)
+    return {"ingested": len(changed), "chunks": chunks, "unchanged": len(docs) - len(changed)}
+
+# ----- Local vector index (optional) -----
+_index_load_lock = asyncio.Lock()
+
+async def load_local_index(version: str | None = None):
+    """
+    Rebuild the in-process chunk index from Neo4j. Concurrent callers share one
+    load: whoever waited on the lock finds the index already at the current
+    version and returns. Redis and the NumPy build run in the threadpool.
+    """
+    idx = vector_index.chunk_index
+    async with _index_load_lock:
+        version = version or await run_in_threadpool(vector_index.current_version)
+        if idx.loaded and idx.version == version:
+            return
+        async with get_driver().session() as session:
+            res = await session.run(Query(vector_index.LOAD_CHUNKS_CYPHER, timeout=NEO4J_INDEX_LOAD_TIMEOUT))
+            records = await res.data()
+        await run_in_threadpool(idx.build, records, version)
+
+async def _search_chunks(q_emb: list[float], k: int) -> list[dict]:
+    idx = vector_index.chunk_index
+    if vector_index.LOCAL_VECTOR_INDEX:
+        if not idx.loaded or await run_in_threadpool(idx.is_stale):
+            await load_local_index()
+        return idx.search(q_emb, k)
+    async with get_driver().session() as session:
+        res = await session.run(Query("""
+            CALL db.index.vector.queryNodes('chunk_embed_idx', $k, $vec)
+            YIELD node, score
+            MATCH (node)-[:PART_OF]->(g:Guideline)
+            RETURN g.title AS title, g.url AS url, node.text AS text, node.idx AS chunk, score
+            ORDER BY score DESC
+            LIMIT $k
+        """, timeout=NEO4J_QUERY_TIMEOUT), k=k, vec=q_emb)
+        return await res.data()
 
 @router.post("/ask")
-async def ask(inp: schemas.AskIn, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+async def ask(inp: schemas.AskIn, db: AsyncSession = Depends(get_async_db), user_id: int = Depends(get_current_user_id)):
     # 1) embed the question
     q_emb = (await ollama_embed([inp.question]))[0]
 
-    # 2) retrieve top-k docs (clamp k to [1, 20])
-    k = max(1, min((inp.k or 8), 20))
-    with driver.session() as session:
-        res = session.run("""
-            CALL db.index.vector.queryNodes('guideline_embed_idx', $k, $vec)
-            YIELD node, score
-            RETURN node.title AS title, node.url AS url, node.text AS text, score
-            LIMIT $k
-        """, k=k, vec=q_emb)
-        hits = [r.data() for r in res]
+    # 2) retrieve top-k passages (clamp k to [1, 20])
+    k = max(1, min((inp.k or 4), 20))
+    hits = await _search_chunks(q_emb, k)
 
-    # 3) compact context block from hits
+    # 3) context block: the matching passages themselves (already CHUNK_SIZE-bounded)
     context = ""
     for i, h in enumerate(hits, 1):
-        snippet = (h["text"] or "")[:500].replace("\n", " ").strip()
-        context += f"[{i}] {h['title']} — {h['url']} :: {snippet}\n"
+        context += f"[{i}] {h['title']} — {h['url']} :: {h['text'] or ''}\n"
 
     # 4) add **user-aware** summary
-    summary = summarize_user(db, user_id, question=inp.question)
+    summary = await summarize_user_async(db, user_id, question=inp.question)
+    await db.close()  # hand the connection back before the (slow) LLM call
     print("DEBUG USER CTX:\n", summary)
     # 5) system/user messages
     system = (
@@ -139,6 +246,6 @@ async def ask(inp: schemas.AskIn, db: Session = Depends(get_db), user_id: int =
 
     return {
         "answer": answer,
-        "sources": [{"title": h["title"], "url": h["url"], "score": h["score"]} for h in hits],
+        "sources": [{"title": h["title"], "url": h["url"], "chunk": h["chunk"], "score": h["score"]} for h in hits],
         "disclaimer": "Educational information only; not a substitute for professional medical advice.",
     }
@@ -1,14 +1,16 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 import datetime as dt
 from datetime import timedelta
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Literal
 from db import get_db
 import models
 from pydantic import BaseModel
 from .deps import get_current_user_id
+from .pagination import keyset_page, MAX_PAGE_SIZE
+from .insights import apply_symptom_changes
 
 router = APIRouter(prefix="/symptoms")
 
@@ -27,19 +29,38 @@ class SymptomUpdate(BaseModel):
     notes: Optional[str] = None
 
 @router.get("/")
-def list_symptoms(month: str | None = None, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
+def list_symptoms(
+    response: Response,
+    month: str | None = None,
+    date_from: Optional[dt.date] = Query(None, alias="from"),
+    date_to: Optional[dt.date] = Query(None, alias="to"),
+    cursor: str | None = None,
+    limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    order: Literal["asc", "desc"] = "asc",
+    db: Session = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
     q = db.query(models.SymptomLog).filter(models.SymptomLog.user_id == user_id)
     if month:
         y, m = map(int, month.split("-"))
         first = dt.date(y, m, 1)
         last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
         q = q.filter(models.SymptomLog.date >= first, models.SymptomLog.date <= last)
-    return q.order_by(models.SymptomLog.date.asc()).all()
+    if date_from:
+        q = q.filter(models.SymptomLog.date >= date_from)
+    if date_to:
+        q = q.filter(models.SymptomLog.date <= date_to)
+    return keyset_page(
+        q, models.SymptomLog.date, models.SymptomLog.id, response,
+        cursor=cursor, limit=limit, order=order,
+    )
 
 @router.post("/", status_code=201)
 def add_symptom(body: SymptomCreate, db: Session = Depends(get_db), user_id: int = Depends(get_current_user_id)):
     s = models.SymptomLog(user_id=user_id, **body.dict())
-    db.add(s); db.commit(); db.refresh(s)
+    db.add(s)
+    apply_symptom_changes(db, user_id, added=[(s.date, s.symptom)])
+    db.commit(); db.refresh(s)
     return s
 
 @router.patch("/{log_id}")
@@ -47,8 +68,11 @@ def update_symptom(log_id: int, body: SymptomUpdate, db: Session = Depends(get_d
     s = db.query(models.SymptomLog).filter_by(id=log_id, user_id=user_id).first()
     if not s:
         raise HTTPException(404, detail="Symptom log not found")
+    before = (s.date, s.symptom, s.severity)
     for k, v in body.dict(exclude_unset=True).items():
         setattr(s, k, v)
+    if (s.date, s.symptom, s.severity) != before:
+        apply_symptom_changes(db, user_id, removed=[before[:2]], added=[(s.date, s.symptom)])
     db.commit(); db.refresh(s)
     return s
 
@@ -57,5 +81,7 @@ def delete_symptom(log_id: int, db: Session = Depends(get_db), user_id: int = De
     s = db.query(models.SymptomLog).filter_by(id=log_id, user_id=user_id).first()
     if not s:
         raise HTTPException(404, detail="Symptom log not found")
-    db.delete(s); db.commit()
+    db.delete(s)
+    apply_symptom_changes(db, user_id, removed=[(s.date, s.symptom)])
+    db.commit()
     return {"detail": "Deleted"}
@@ -62,4 +62,4 @@ class IngestIn(BaseModel):
     
 class AskIn(BaseModel):
     question: str
-    k: int = 8
+    k: int = 4
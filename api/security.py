@@ -1,18 +1,97 @@
 from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
 from jose import jwt
 from passlib.context import CryptContext
-import os
+import asyncio, multiprocessing, os, time
 
 ALGORITHM = "HS256"
 JWT_SECRET = os.getenv("JWT_SECRET", "change-me")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt runs in a dedicated process pool so a login storm can't pin the
+# event loop or the threadpool that serves the sync routes.
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", str(os.cpu_count() or 2)))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "32"))  # waiting (not running) hashes before we shed load
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", "2"))  # seconds, sent as Retry-After on 429
+
+_hash_pool: ProcessPoolExecutor | None = None
+_hash_slots = asyncio.Semaphore(HASH_MAX_CONCURRENCY)
+_hash_stats = {
+    "hashes": 0,
+    "verifies": 0,
+    "rejected": 0,
+    "started": 0,
+    "running": 0,
+    "waiting": 0,
+    "queue_wait_ms_total": 0.0,
+    "queue_wait_ms_max": 0.0,
+}
+
 def hash_password(pw: str):
     return pwd_context.hash(pw)
 
 def verify_password(pw: str, pw_hash: str):
     return pwd_context.verify(pw, pw_hash)
 
+def _get_hash_pool() -> ProcessPoolExecutor:
+    global _hash_pool
+    if _hash_pool is None:
+        _hash_pool = ProcessPoolExecutor(
+            max_workers=HASH_MAX_CONCURRENCY,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _hash_pool
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+async def _run_bcrypt(fn, *args):
+    if _hash_stats["waiting"] >= HASH_MAX_QUEUE:
+        _hash_stats["rejected"] += 1
+        raise HTTPException(
+            429,
+            detail="Too many sign-in attempts right now. Please try again shortly.",
+            headers={"Retry-After": str(HASH_RETRY_AFTER)},
+        )
+    _hash_stats["waiting"] += 1
+    t0 = time.perf_counter()
+    try:
+        await _hash_slots.acquire()
+    finally:
+        _hash_stats["waiting"] -= 1
+    waited_ms = (time.perf_counter() - t0) * 1000
+    _hash_stats["queue_wait_ms_total"] += waited_ms
+    _hash_stats["queue_wait_ms_max"] = max(_hash_stats["queue_wait_ms_max"], waited_ms)
+    _hash_stats["started"] += 1
+    _hash_stats["running"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), fn, *args)
+    finally:
+        _hash_stats["running"] -= 1
+        _hash_slots.release()
+
+async def hash_password_async(pw: str) -> str:
+    _hash_stats["hashes"] += 1
+    return await _run_bcrypt(hash_password, pw)
+
+async def verify_password_async(pw: str, pw_hash: str) -> bool:
+    _hash_stats["verifies"] += 1
+    return await _run_bcrypt(verify_password, pw, pw_hash)
+
+def hashing_stats() -> dict:
+    started = _hash_stats["started"]
+    avg = _hash_stats["queue_wait_ms_total"] / started if started else 0.0
+    return {
+        **_hash_stats,
+        "queue_wait_ms_avg": round(avg, 2),
+        "max_concurrency": HASH_MAX_CONCURRENCY,
+        "max_queue": HASH_MAX_QUEUE,
+    }
+
 def create_token(user_id: int, token_version: int = 0, expires_minutes: int = 60*24*30) -> str:
     exp = datetime.utcnow() + timedelta(minutes=expires_minutes)
     payload = {"sub": str(user_id), "tv": int(token_version), "exp": exp}
@@ -2,18 +2,26 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import date, datetime, timedelta
+from functools import lru_cache
 from typing import List, Optional, Tuple, Literal
+from bisect import bisect_right
+from collections import namedtuple
+from sqlalchemy import Date, Integer, String, cast, literal, null, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-import re
+from fastapi.concurrency import run_in_threadpool
+import os, re
 
 import models  # CycleLog, SymptomLog
+from cache import cache_get, cache_set, user_generation
 
 # -----------------------
 # Tunables (safe defaults)
 # -----------------------
 MAX_CTX_CYCLES = 4          # default recent cycles in baseline context
 MAX_CTX_SYMPTOMS = 20       # default recent symptoms in baseline context
-EVIDENCE_MAX_SYMPTOMS = 200 # hard-cap of raw symptom rows in the question-specific evidence block
+EVIDENCE_TOKEN_BUDGET = int(os.getenv("EVIDENCE_TOKEN_BUDGET", "600"))  # approx. tokens for the evidence block
+USER_CONTEXT_TTL = int(os.getenv("USER_CONTEXT_TTL", "120"))  # seconds an assembled context is reused
 
 # -----------------------
 # Public API
@@ -23,43 +31,116 @@ def summarize_user(db: Session, user_id: int, question: Optional[str] = None) ->
     Builds the USER CONTEXT block. If `question` is provided, we also include a
     'QUESTION-SPECIFIC EVIDENCE' block consisting of only the minimal slice
     of data likely needed to answer the question (e.g., "3 months ago", "May 2025").
+    Baseline and window come back from one statement; the result is cached
+    briefly per (user, window) until the user's next cycle/symptom write.
     """
-    baseline = _baseline_context(db, user_id)
+    win = parse_question_window(question, today=date.today()) if question else None
+    key, ctx = _cached_context(user_id, win)
+    if ctx is None:
+        ctx = _assemble(db.execute(_context_stmt(user_id, win)), win)
+        cache_set(key, ctx, USER_CONTEXT_TTL)
+    return ctx
 
-    if not question:
-        return baseline
 
-    win = parse_question_window(question, today=date.today())
+async def summarize_user_async(db: AsyncSession, user_id: int, question: Optional[str] = None) -> str:
+    """Same as `summarize_user`, for async routes (no event-loop blocking on DB or cache I/O)."""
+    win = parse_question_window(question, today=date.today()) if question else None
+    # sync cache client: keep its round-trips off the event loop
+    key, ctx = await run_in_threadpool(_cached_context, user_id, win)
+    if ctx is None:
+        ctx = _assemble(await db.execute(_context_stmt(user_id, win)), win)
+        await run_in_threadpool(cache_set, key, ctx, USER_CONTEXT_TTL)
+    return ctx
+
 
-    # If we couldn't infer a window, return baseline only
+# -----------------------
+# Single round-trip context query
+# -----------------------
+_CycleRow = namedtuple("_CycleRow", "start_date end_date")
+_SymptomRow = namedtuple("_SymptomRow", "date symptom severity")
+
+def _context_key(user_id: int, win) -> str:
+    scope = "base" if not win else f"{win[0]}:{win[1].isoformat()}:{win[2].isoformat()}"
+    return f"ctx:{user_id}:{user_generation(user_id)}:{scope}"
+
+def _cached_context(user_id: int, win) -> Tuple[str, Optional[str]]:
+    key = _context_key(user_id, win)
+    return key, cache_get(key)
+
+def _cycle_cols(kind: str):
+    C = models.CycleLog
+    return (literal(kind).label("kind"), C.start_date.label("d"), C.end_date.label("end_date"),
+            cast(null(), String).label("symptom"), cast(null(), Integer).label("severity"))
+
+def _symptom_cols(kind: str):
+    S = models.SymptomLog
+    return (literal(kind).label("kind"), S.date.label("d"), cast(null(), Date).label("end_date"),
+            S.symptom.label("symptom"), S.severity.label("severity"))
+
+def _context_stmt(user_id: int, win):
+    """UNION ALL of the baseline slice and (optionally) the question window, tagged by kind."""
+    cycles_q, symptoms_q = _baseline_stmts(user_id)
+    parts = [cycles_q.with_only_columns(*_cycle_cols("base_cycle")),
+             symptoms_q.with_only_columns(*_symptom_cols("base_symptom"))]
+    if win:
+        c_q, s_q = _window_stmts(user_id, *win)
+        if c_q is not None:
+            parts.append(c_q.with_only_columns(*_cycle_cols("cycle")))
+        if s_q is not None:
+            parts.append(s_q.with_only_columns(*_symptom_cols("symptom")))
+    # Each branch keeps its own ORDER BY/LIMIT inside a subquery
+    return union_all(*(select(*p.subquery().c) for p in parts))
+
+_prompt_stats = {"contexts": 0, "tokens_total": 0, "tokens_max": 0}
+
+def prompt_stats() -> dict:
+    """Estimated size of freshly assembled user contexts (cache hits aren't counted)."""
+    n = _prompt_stats["contexts"]
+    return {**_prompt_stats, "tokens_avg": round(_prompt_stats["tokens_total"] / n, 1) if n else 0.0}
+
+def _assemble(rows, win) -> str:
+    ctx = _render(rows, win)
+    tokens = estimate_tokens(ctx)
+    _prompt_stats["contexts"] += 1
+    _prompt_stats["tokens_total"] += tokens
+    _prompt_stats["tokens_max"] = max(_prompt_stats["tokens_max"], tokens)
+    return ctx
+
+def _render(rows, win) -> str:
+    out: dict = {"base_cycle": [], "base_symptom": [], "cycle": [], "symptom": []}
+    for kind, d, end_date, symptom, severity in rows:
+        out[kind].append(_CycleRow(d, end_date) if kind.endswith("cycle") else _SymptomRow(d, symptom, severity))
+    # UNION ALL doesn't preserve branch order; restore each query's ORDER BY
+    out["base_cycle"].sort(key=lambda r: r.start_date, reverse=True)
+    out["base_symptom"].sort(key=lambda r: r.date, reverse=True)
+    out["cycle"].sort(key=lambda r: r.start_date)
+    out["symptom"].sort(key=lambda r: r.date)
+    baseline = _format_baseline(out["base_cycle"], out["base_symptom"])
     if not win:
         return baseline
-
     subject, dfrom, dto = win
-    cycles, symptoms = fetch_window(db, user_id, subject=subject, date_from=dfrom, date_to=dto)
-
-    ev = _format_evidence(cycles, symptoms, subject, dfrom, dto)
-    return f"{baseline}\n\n{ev}"
+    return f"{baseline}\n\n{_format_evidence(out['cycle'], out['symptom'], subject, dfrom, dto)}"
 
 
 # -----------------------
 # Baseline (recent slice)
 # -----------------------
-def _baseline_context(db: Session, user_id: int) -> str:
+def _baseline_stmts(user_id: int):
     cycles = (
-        db.query(models.CycleLog)
-        .filter(models.CycleLog.user_id == user_id)
+        select(models.CycleLog)
+        .where(models.CycleLog.user_id == user_id)
         .order_by(models.CycleLog.start_date.desc())
         .limit(MAX_CTX_CYCLES)
-        .all()
     )
     symptoms = (
-        db.query(models.SymptomLog)
-        .filter(models.SymptomLog.user_id == user_id)
+        select(models.SymptomLog)
+        .where(models.SymptomLog.user_id == user_id)
         .order_by(models.SymptomLog.date.desc())
         .limit(MAX_CTX_SYMPTOMS)
-        .all()
     )
+    return cycles, symptoms
+
+def _format_baseline(cycles, symptoms) -> str:
     lines = [
         "USER CONTEXT",
         f"- Last period starts: {_fmt_cycles(cycles)}",
@@ -71,13 +152,26 @@ def _baseline_context(db: Session, user_id: int) -> str:
 # -----------------------
 # Evidence formatting
 # -----------------------
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 chars/token for English with dates) for prompt budgeting."""
+    return (len(text) + 3) // 4
+
 def _format_evidence(
     cycles: List["models.CycleLog"],
     symptoms: List["models.SymptomLog"],
     subject: Literal["cycles", "symptoms", "both"],
     dfrom: date,
     dto: date,
+    budget: Optional[int] = None,
 ) -> str:
+    """
+    Cycle ranges are always listed verbatim (the chat prompt tells the model to
+    copy them). Symptoms are compacted to fit the remaining token budget: per
+    cycle (or per month when cycles aren't in scope) each symptom becomes a count,
+    its date ranges and a severity range; if that is still too long we drop the
+    ranges, then fall back to window-wide totals.
+    """
+    budget = EVIDENCE_TOKEN_BUDGET if budget is None else budget
     parts = [
         "QUESTION-SPECIFIC EVIDENCE",
         f"- Window: {dfrom.isoformat()} → {dto.isoformat()}",
@@ -91,54 +185,117 @@ def _format_evidence(
             for c in cycles:
                 parts.append(f"  - {c.start_date.isoformat()} to {c.end_date.isoformat()}")
     if subject in ("symptoms", "both"):
-        parts.append("Symptoms in window:")
         if not symptoms:
-            parts.append("  (none)")
+            parts += ["Symptoms in window:", "  (none)"]
         else:
-            for s in symptoms[:EVIDENCE_MAX_SYMPTOMS]:
-                sev = f" (sev {s.severity})" if getattr(s, "severity", None) is not None else ""
-                parts.append(f"  - {s.date.isoformat()}: {s.symptom}{sev}")
-            if len(symptoms) > EVIDENCE_MAX_SYMPTOMS:
-                parts.append(f"  ... {len(symptoms) - EVIDENCE_MAX_SYMPTOMS} more omitted")
+            remaining = budget - estimate_tokens("\n".join(parts))
+            parts += _compact_symptoms(cycles, symptoms, remaining)
     return "\n".join(parts)
 
+def _compact_symptoms(cycles, symptoms, budget: int) -> List[str]:
+    header = f"Symptoms in window ({len(symptoms)} logs):"
+    groups = _group_symptoms(cycles, symptoms)
+    for detail in ("ranges", "counts"):
+        lines = [header]
+        for label, logs in groups:
+            lines.append(f"  {label}:")
+            lines += [f"    - {ln}" for ln in _symptom_lines(logs, detail)]
+        if estimate_tokens("\n".join(lines)) <= budget:
+            return lines
+    # Window-wide totals, cut at the budget
+    lines = [header + " totals"]
+    totals = _symptom_lines(symptoms, "counts")
+    for i, ln in enumerate(totals):
+        if estimate_tokens("\n".join(lines + [f"  - {ln}"])) > budget:
+            lines.append(f"  ... {len(totals) - i} more symptoms omitted")
+            break
+        lines.append(f"  - {ln}")
+    return lines
+
+def _group_symptoms(cycles, symptoms):
+    """Split (date-sorted) symptoms by the cycle they fall in, or by month without cycles."""
+    if not cycles:
+        by_month: dict = {}
+        for s in symptoms:
+            by_month.setdefault(s.date.strftime("%Y-%m"), []).append(s)
+        return [(f"Month {m}", logs) for m, logs in by_month.items()]
+    starts = [c.start_date for c in cycles]
+    groups: dict = {}
+    for s in symptoms:
+        i = bisect_right(starts, s.date) - 1
+        groups.setdefault(i, []).append(s)
+    return [("Before first cycle" if i < 0 else f"Cycle from {starts[i].isoformat()}", logs)
+            for i, logs in sorted(groups.items())]
+
+def _symptom_lines(logs, detail: Literal["ranges", "counts"]) -> List[str]:
+    by_name: dict = {}
+    for s in logs:
+        by_name.setdefault(s.symptom, []).append(s)
+    lines = []
+    for name, items in sorted(by_name.items(), key=lambda kv: (-len(kv[1]), kv[0])):
+        days = sorted({s.date for s in items})
+        if detail == "ranges":
+            where = ", ".join(_date_ranges(days))
+        else:
+            where = days[0].isoformat() if len(days) == 1 else f"{days[0].isoformat()}..{days[-1].isoformat()}"
+        sevs = [s.severity for s in items if getattr(s, "severity", None) is not None]
+        sev = "" if not sevs else f", sev {min(sevs)}" if min(sevs) == max(sevs) else f", sev {min(sevs)}-{max(sevs)}"
+        lines.append(f"{name} x{len(items)}: {where}{sev}")
+    return lines
+
+def _date_ranges(days: List[date]) -> List[str]:
+    """Collapse sorted dates into 'start..end' runs of consecutive days."""
+    out, start, prev = [], None, None
+    for d in days + [None]:
+        if start is not None and (d is None or (d - prev).days > 1):
+            out.append(start.isoformat() if start == prev else f"{start.isoformat()}..{prev.isoformat()}")
+            start = None
+        if d is not None:
+            start = start or d
+            prev = d
+    return out
+
 
 # -----------------------
 # Fetchers
 # -----------------------
-def fetch_window(
-    db: Session,
+def _window_stmts(
     user_id: int,
     subject: Literal["cycles", "symptoms", "both"],
     date_from: date,
     date_to: date,
-) -> Tuple[List["models.CycleLog"], List["models.SymptomLog"]]:
-    c: List["models.CycleLog"] = []
-    s: List["models.SymptomLog"] = []
-
+):
+    c_q = s_q = None
     if subject in ("cycles", "both"):
-        q = (
-            db.query(models.CycleLog)
-            .filter(models.CycleLog.user_id == user_id)
-            .filter(models.CycleLog.start_date >= date_from)
-            .filter(models.CycleLog.start_date <= date_to)
+        c_q = (
+            select(models.CycleLog)
+            .where(models.CycleLog.user_id == user_id)
+            .where(models.CycleLog.start_date >= date_from)
+            .where(models.CycleLog.start_date <= date_to)
             .order_by(models.CycleLog.start_date.asc())
         )
-        c = q.all()
-
     if subject in ("symptoms", "both"):
-        q = (
-            db.query(models.SymptomLog)
-            .filter(models.SymptomLog.user_id == user_id)
-            .filter(models.SymptomLog.date >= date_from)
-            .filter(models.SymptomLog.date <= date_to)
+        s_q = (
+            select(models.SymptomLog)
+            .where(models.SymptomLog.user_id == user_id)
+            .where(models.SymptomLog.date >= date_from)
+            .where(models.SymptomLog.date <= date_to)
             .order_by(models.SymptomLog.date.asc())
         )
-        s = q.all()
+    return c_q, s_q
 
+def fetch_window(
+    db: Session,
+    user_id: int,
+    subject: Literal["cycles", "symptoms", "both"],
+    date_from: date,
+    date_to: date,
+) -> Tuple[List["models.CycleLog"], List["models.SymptomLog"]]:
+    c_q, s_q = _window_stmts(user_id, subject, date_from, date_to)
+    c: List["models.CycleLog"] = list(db.scalars(c_q).all()) if c_q is not None else []
+    s: List["models.SymptomLog"] = list(db.scalars(s_q).all()) if s_q is not None else []
     return c, s
 
-
 # -----------------------
 # Heuristic question parsing
 # -----------------------
@@ -157,6 +314,18 @@ MONTHS = {
     "december":12,"dec":12,
 }
 
+# Question-window rules, compiled once at import instead of on every call
+_RANGE_RE = re.compile(r"(?:from|between)\s*(\d{4}-\d{1,2}-\d{1,2})\s*(?:to|and|through|-)\s*(\d{4}-\d{1,2}-\d{1,2})")
+_ISO_RE = re.compile(r"(?:on\s*)?(\d{4}-\d{1,2}-\d{1,2})")
+_LAST_N_MONTHS_RE = re.compile(r"last\s+(\d+)\s+months?")
+_LAST_MONTH_RE = re.compile(r"last\s+month")
+_MONTHS_AGO_RE = re.compile(r"(\d+)\s+months?\s+ago")
+_MONTH_NAME_RE = re.compile(r"\b(" + "|".join(MONTHS.keys()) + r")\b(?:\s+(\d{4}))?")
+_YEAR_RE = re.compile(r"\b(20\d{2})\b")
+_WEEKS_AGO_RE = re.compile(r"(\d+)\s+weeks?\s+ago")
+
+WINDOW_CACHE_SIZE = 4096
+
 def parse_question_window(q: str, today: date):
     """
     Extract (subject, date_from, date_to) from natural-language question.
@@ -166,28 +335,33 @@ def parse_question_window(q: str, today: date):
       - "in May 2025", "May 2025", "May"
       - "from 2025-05-01 to 2025-06-15", "between 2025-05-01 and 2025-05-31"
       - "on 2025-05-12"
+    Memoized per (question, today).
     """
+    return _parse_question_window(q, today)
+
+@lru_cache(maxsize=WINDOW_CACHE_SIZE)
+def _parse_question_window(q: str, today: date):
     text = q.lower().strip()
 
     # Subject hints
     subj = classify_subject(text)
 
     # ISO date range: from X to Y / between X and Y
-    m = re.search(r"(?:from|between)\s*(\d{4}-\d{1,2}-\d{1,2})\s*(?:to|and|through|-)\s*(\d{4}-\d{1,2}-\d{1,2})", text)
+    m = _RANGE_RE.search(text)
     if m:
         d1 = _parse_iso(m.group(1)); d2 = _parse_iso(m.group(2))
         if d1 and d2 and d1 <= d2:
             return subj, d1, d2
 
     # Single ISO date: "on 2025-05-12" or bare "2025-05-12"
-    m = re.search(r"(?:on\s*)?(\d{4}-\d{1,2}-\d{1,2})", text)
+    m = _ISO_RE.search(text)
     if m:
         d = _parse_iso(m.group(1))
         if d:
             return subj, d, d
 
     # last N months
-    m = re.search(r"last\s+(\d+)\s+months?", text)
+    m = _LAST_N_MONTHS_RE.search(text)
     if m:
         n = int(m.group(1))
         dfrom = _add_months(today.replace(day=1), -n)
@@ -196,13 +370,13 @@ def parse_question_window(q: str, today: date):
             return subj, dfrom, dto
 
     # last month
-    if re.search(r"last\s+month", text):
+    if _LAST_MONTH_RE.search(text):
         start_prev = _add_months(today.replace(day=1), -1)
         end_prev = today.replace(day=1) - timedelta(days=1)
         return subj, start_prev, end_prev
 
     # N months ago  (choose full month N back)
-    m = re.search(r"(\d+)\s+months?\s+ago", text)
+    m = _MONTHS_AGO_RE.search(text)
     if m:
         n = int(m.group(1))
         target = _add_months(today.replace(day=1), -n)
@@ -211,16 +385,16 @@ def parse_question_window(q: str, today: date):
         return subj, start, end
 
     # Month name (with optional year)
-    m = re.search(r"\b(" + "|".join(MONTHS.keys()) + r")\b(?:\s+(\d{4}))?", text)
+    m = _MONTH_NAME_RE.search(text)
     if m:
         mon = MONTHS[m.group(1)]
         yr = int(m.group(2)) if m.group(2) else today.year
         start = date(yr, mon, 1)
         end = _end_of_month(start)
         return subj, start, end
-    
+
     # whole year
-    m = re.search(r"\b(20\d{2})\b", text)
+    m = _YEAR_RE.search(text)
     if m:
         yr = int(m.group(1))
         start = date(yr, 1, 1)
@@ -228,7 +402,7 @@ def parse_question_window(q: str, today: date):
         return subj, start, end
 
     # "3 weeks ago" -> pick that week (Mon..Sun)
-    m = re.search(r"(\d+)\s+weeks?\s+ago", text)
+    m = _WEEKS_AGO_RE.search(text)
     if m:
         n = int(m.group(1))
         target = today - timedelta(weeks=n)
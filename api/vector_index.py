@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+import numpy as np
+
+from cache import cache_get, cache_set
+
+# Optional in-process copy of the chunk embeddings for /ask. The curated corpus
+# is small and read-mostly, so an exact NumPy cosine scan is sub-millisecond and
+# saves the Bolt round-trip. Neo4j stays the system of record: the matrix is
+# (re)loaded from it at startup and after every /ingest that changed something.
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "false").lower() == "true"
+# Other workers learn about an ingest through a corpus version in the shared
+# cache; they compare it at most this often (seconds).
+LOCAL_VECTOR_INDEX_CHECK = float(os.getenv("LOCAL_VECTOR_INDEX_CHECK", "10"))
+
+_VERSION_KEY = "rag:corpus_version"
+_VERSION_TTL = 365 * 24 * 3600
+
+LOAD_CHUNKS_CYPHER = """
+    MATCH (c:Chunk)-[:PART_OF]->(g:Guideline)
+    WHERE c.embedding IS NOT NULL
+    RETURN g.title AS title, g.url AS url, c.text AS text, c.idx AS chunk, c.embedding AS embedding
+"""
+
+
+class ChunkIndex:
+    def __init__(self):
+        self._matrix: Optional[np.ndarray] = None  # (n, dim) float32, rows L2-normalized
+        self._meta: list[dict] = []
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._matrix is not None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def build(self, records: list[dict], version: Optional[str] = None):
+        """Replace the index with `records` (title, url, text, chunk, embedding)."""
+        if records:
+            m = np.asarray([r["embedding"] for r in records], dtype=np.float32)
+            m /= np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+        else:
+            m = np.zeros((0, 0), dtype=np.float32)
+        meta = [{k: r[k] for k in ("title", "url", "text", "chunk")} for r in records]
+        with self._lock:  # swap both together so readers never see a mismatched pair
+            self._matrix, self._meta = m, meta
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def search(self, vec: list[float], k: int) -> list[dict]:
+        """
+        Top-k chunks by cosine similarity. Scores use Neo4j's cosine scale,
+        (1 + cos) / 2, so results are interchangeable with the index query.
+        """
+        with self._lock:
+            m, meta = self._matrix, self._meta
+        if m is None or not len(meta):
+            return []
+        q = np.asarray(vec, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        sims = m @ q
+        k = min(k, len(meta))
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top], kind="stable")]
+        return [{**meta[i], "score": (1.0 + min(1.0, float(sims[i]))) / 2.0} for i in top]
+
+    def is_stale(self) -> bool:
+        """True when another worker ingested since we loaded (checked at most every few seconds)."""
+        now = time.monotonic()
+        if now - self._checked_at < LOCAL_VECTOR_INDEX_CHECK:
+            return False
+        self._checked_at = now
+        return (cache_get(_VERSION_KEY) or None) != self._version
+
+
+def current_version() -> Optional[str]:
+    return cache_get(_VERSION_KEY)
+
+
+def bump_version() -> str:
+    version = uuid.uuid4().hex
+    cache_set(_VERSION_KEY, version, _VERSION_TTL)
+    return version
+
+
+chunk_index = ChunkIndex()